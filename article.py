@@ -0,0 +1,49 @@
+import sys
+
+#sheet column headers, in the same order as Article.to_row()
+SHEET_COLUMNS = ['Title', 'Abstract', 'Published', 'Link', 'Source', 'Query', 'SearchDate', 'Category', 'Topic Check', 'Topic Check Query', 'Relevant_pred']
+
+class Article:
+    #compact record passed through every stage of the run - produced directly by the search parsers and updated in place
+    #hand written with __slots__ rather than @dataclass(slots=True) as the lambda image runs python 3.9
+    __slots__ = ('title', 'abstract', 'published', 'link', 'source', 'query', 'search_date', 'category',
+                 'topic_check', 'topic_check_query', 'relevant_pred', 'relevant_prob', 'doi', 'updated')
+
+    def __init__(self, title='', abstract='', published='', link='', source='', query='', search_date='', category='N/A',
+                 topic_check='', topic_check_query='', relevant_pred='', relevant_prob='', doi='', updated=''):
+        self.title = title
+        self.abstract = abstract
+        self.published = published
+        self.link = link
+        #source and query repeat across every article of a run so share one string object each
+        self.source = sys.intern(source)
+        self.query = sys.intern(query)
+        self.search_date = search_date
+        self.category = category
+        self.topic_check = topic_check
+        self.topic_check_query = topic_check_query
+        self.relevant_pred = relevant_pred
+        #probability behind relevant_pred when the model is run with a threshold - kept off the sheet row
+        self.relevant_prob = relevant_prob
+        self.doi = doi
+        self.updated = updated
+
+    def set_query(self, query, search_date):
+        self.query = sys.intern(query)
+        self.search_date = search_date
+
+    def to_row(self):
+        #sheet row in SHEET_COLUMNS order, read straight from the slots
+        return [self.title, self.abstract, self.published, self.link, self.source, self.query, self.search_date, self.category,
+                self.topic_check, self.topic_check_query, self.relevant_pred]
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    def __eq__(self, other):
+        if not isinstance(other, Article):
+            return NotImplemented
+        return all(getattr(self, field) == getattr(other, field) for field in self.__slots__)
+
+    def __repr__(self):
+        return f'Article(title={self.title!r}, source={self.source!r}, link={self.link!r})'
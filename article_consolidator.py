@@ -1,51 +1,98 @@
+from datetime import datetime
+import threading
 import arxiv_search as ar
+import instrumentation as im
 import pubmed_search as pb
+from rate_limiter import RateLimiter
+
+#shared across all consolidators in the process so concurrent searches stay within each API's limits
+#NCBI allows 3 requests/sec without an API key, arXiv asks for 1 request every 3 seconds on a single connection
+SOURCE_RATE_LIMITERS = {
+    "pubmed": RateLimiter(3),
+    "arxiv": RateLimiter(1 / 3)
+}
+SOURCE_MAX_CONCURRENCY = {
+    "pubmed": 3,
+    "arxiv": 1
+}
+SOURCE_SEMAPHORES = {source: threading.BoundedSemaphore(limit) for source, limit in SOURCE_MAX_CONCURRENCY.items()}
+SOURCE_ORDER = ["pubmed", "arxiv"]
 
 class ArticleConsolidator:
-    def __init__(self, query, max_results, min_date=None, search_date=None, search_sources=[]):
+    def __init__(self, query, max_results, min_date=None, search_date=None, search_sources=[], watermark_store=None, max_date=None, incremental_max_results=10000):
         self.query = query
         self.max_results = max_results
         self.min_date = min_date
+        #optional end of a fixed YYYY/MM/DD publication window (with min_date) e.g. for backfills
+        self.max_date = max_date
         self.search_date = search_date
         self.search_sources = search_sources
-    
-    def consolidate(self):
-        articles = []
-
-        if "pubmed" in self.search_sources:
-
-            pubmed_search = pb.PubMedSearch(self.query, max_results=self.max_results, min_date=self.min_date)
-            pubmed_articles = pubmed_search.search()
-            
-            
-            for pubmed_article in pubmed_articles:
-                articles.append({
-                    'Title': pubmed_article['title'],
-                    'Abstract': pubmed_article['abstract'],
-                    'Published': pubmed_article['pubdate'],
-                    'Link': pubmed_article['link'],
-                    'Source': 'PubMed', 
-                    'Query': self.query,
-                    'SearchDate': self.search_date, 
-                    'Category': "N/A"
-                })
-
-        if "arxiv" in self.search_sources:
-            #NOTE: added due to low quality menopause results
-            if "menopause" not in self.query:
-                arxiv_search = ar.ArxivSearch(self.query, max_results=self.max_results)
-                arxiv_articles = arxiv_search.search()
-                
-                for arxiv_article in arxiv_articles:
-                    articles.append({
-                        'Title': arxiv_article['title'],
-                        'Abstract': arxiv_article['summary'],
-                        'Published': arxiv_article['published'],
-                        'Link': arxiv_article['link'],
-                        'Source': 'Arxiv',
-                        'Query': self.query,
-                        'SearchDate': self.search_date,
-                        'Category': "N/A"
-                    })
-        
-        return articles
\ No newline at end of file
+        #optional watermark_store.WatermarkStore - when set only items newer than the previous run are requested
+        self.watermark_store = watermark_store
+        #results cap once a watermark exists - high enough that a day's new items are never cut short
+        #a truncated search leaves the watermark where it was, so the items past the cap are requested again next run
+        self.incremental_max_results = incremental_max_results
+        #per source, set once its search has finished - True when max_results cut the search short
+        self.truncated = {}
+
+    def search_source(self, source):
+        return [self.normalize(source, article) for article in self.iter_source(source)]
+
+    def iter_source(self, source):
+        #yields search results as they arrive so a pipeline can start on them before the search completes
+        with SOURCE_SEMAPHORES[source]:
+            if source == "pubmed":
+                yield from self.iter_pubmed()
+            elif source == "arxiv":
+                yield from self.iter_arxiv()
+
+    def normalize(self, source, article):
+        #parsers already return Article records, so only the run fields are filled in - no per-hop copy
+        article.set_query(self.query, self.search_date)
+        return article
+
+    def iter_pubmed(self):
+        if self.watermark_store is not None and self.watermark_store.get(self.query, "pubmed") is not None:
+            #only articles added to PubMed (entrez date) since the last run - the watermark day is included and dedup drops repeats
+            watermark_date = self.watermark_store.get(self.query, "pubmed")
+            pubmed_search = pb.PubMedSearch(self.query, max_results=max(self.max_results, self.incremental_max_results), min_date=watermark_date, rate_limiter=SOURCE_RATE_LIMITERS["pubmed"], max_date='3000', date_type='edat')
+        elif self.max_date is not None:
+            pubmed_search = pb.PubMedSearch(self.query, max_results=self.max_results, min_date=self.min_date, rate_limiter=SOURCE_RATE_LIMITERS["pubmed"], max_date=self.max_date, date_type='pdat')
+        else:
+            pubmed_search = pb.PubMedSearch(self.query, max_results=self.max_results, min_date=self.min_date, rate_limiter=SOURCE_RATE_LIMITERS["pubmed"])
+        search_started_date = datetime.now().strftime('%Y/%m/%d')
+        pubmed_articles = pubmed_search.search()
+        self.truncated["pubmed"] = pubmed_search.truncated
+
+        if self.watermark_store is not None:
+            self.update_watermark("pubmed", search_started_date, pubmed_search.truncated)
+
+        yield from pubmed_articles
+
+    def update_watermark(self, source, watermark, truncated):
+        #the first run sets the watermark even when truncated - older history is left to backfill.py
+        if truncated and self.watermark_store.get(self.query, source) is not None:
+            im.incr(f"watermark.truncated.{source}")
+            print(f"{source} search for '{self.query}' hit its results cap - watermark not advanced")
+            return
+        self.watermark_store.update(self.query, source, watermark)
+
+    def iter_arxiv(self):
+        #NOTE: added due to low quality menopause results
+        if "menopause" not in self.query:
+            updated_after = self.watermark_store.get(self.query, "arxiv") if self.watermark_store is not None else None
+            submitted_date_range = (self.min_date.replace('/', ''), self.max_date.replace('/', '')) if self.max_date is not None else None
+            #paging stops at the watermark, so the higher cap only matters on a day with unusually many updates
+            max_results = max(self.max_results, self.incremental_max_results) if updated_after is not None else self.max_results
+            arxiv_search = ar.ArxivSearch(self.query, max_results=max_results, rate_limiter=SOURCE_RATE_LIMITERS["arxiv"], updated_after=updated_after, submitted_date_range=submitted_date_range)
+
+            newest_updated = None
+            for arxiv_article in arxiv_search.iter_search():
+                if newest_updated is None or arxiv_article.updated > newest_updated:
+                    newest_updated = arxiv_article.updated
+                yield arxiv_article
+            self.truncated["arxiv"] = arxiv_search.truncated
+
+            #only moved once paging has finished, so a search cut short by max_results does not skip the rest
+            if self.watermark_store is not None:
+                self.update_watermark("arxiv", newest_updated, arxiv_search.truncated)
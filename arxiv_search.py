@@ -1,45 +1,124 @@
-import urllib, urllib.request
+import os
+import random
+import time
+import urllib, urllib.error, urllib.request
 import xml.etree.ElementTree as ET
+from article import Article
+import instrumentation as im
+from rate_limiter import RateLimiter
+
+ATOM_NAMESPACE = '{http://www.w3.org/2005/Atom}'
+ARXIV_NAMESPACE = '{http://arxiv.org/schemas/atom}'
+OPENSEARCH_NAMESPACE = '{http://a9.com/-/spec/opensearch/1.1/}'
 
 class ArxivSearch:
-    def __init__(self, query, max_results):
+    def __init__(self, query, max_results, rate_limiter=None, page_size=100, updated_after=None, submitted_date_range=None, max_retries=5):
         self.query = query
         self.max_results = max_results
-        
+        #optional shared limiter (see rate_limiter.RateLimiter) called before every request
+        #without one, pages are still spaced by arXiv's requested 3 second delay
+        self.rate_limiter = rate_limiter if rate_limiter is not None else RateLimiter(1 / 3)
+        #number of results requested per page of the API
+        self.page_size = page_size
+        #results are sorted by last updated, so paging stops at the first entry not updated after this timestamp
+        self.updated_after = updated_after
+        #optional (from, to) YYYYMMDD strings restricting results to a submission date window e.g. for backfills
+        self.submitted_date_range = submitted_date_range
+        self.max_retries = max_retries
+        #overridable e.g. to point at a local fake server (see benchmarks/fake_services.py)
+        self.base_url = os.getenv('ARXIV_BASE_URL', 'https://export.arxiv.org/api/query?')
+        #total matching results reported by the API, set once the first page is read
+        self.total_results = None
+        #set when paging stopped at max_results with more matching results left (and the updated_after watermark not reached)
+        self.truncated = False
+
     def search(self):
+        return list(self.iter_search())
+
+    def iter_search(self):
+        #pages through start/max_results windows and yields each article as soon as its entry is parsed
+        start = 0
+        self.truncated = False
+        while True:
+            if start >= self.max_results:
+                self.truncated = self.total_results is None or self.total_results > start
+                break
+            page_max_results = min(self.page_size, self.max_results - start)
+            n_entries = 0
+            for article in self.iter_page(start, page_max_results):
+                if self.updated_after is not None and article.updated <= self.updated_after:
+                    return
+                n_entries += 1
+                yield article
+
+            start += n_entries
+            #stop on a short page or once every matching result has been returned
+            if n_entries < page_max_results or (self.total_results is not None and start >= self.total_results):
+                break
+
+    def iter_page(self, start, page_max_results):
         # Create the API request URL
-        base_url = 'https://export.arxiv.org/api/query?'
+        search_query = f'all:{self.query}'
+        if self.submitted_date_range is not None:
+            search_query += f' AND submittedDate:[{self.submitted_date_range[0]}0000 TO {self.submitted_date_range[1]}2359]'
         query_params = {
-            'search_query': f'all:{self.query}',
-            'start': 0,
-            'max_results': self.max_results,
+            'search_query': search_query,
+            'start': start,
+            'max_results': page_max_results,
             'sortBy': 'lastUpdatedDate',
             'sortOrder': 'descending'
         }
-        url = base_url + urllib.parse.urlencode(query_params)
+        url = self.base_url + urllib.parse.urlencode(query_params)
+
+        # Send the request and parse the response incrementally, clearing each entry once read so memory stays flat
+        data = self.urlopen_with_retry(url)
+        with data:
+            root = None
+            for event, elem in ET.iterparse(data, events=('start', 'end')):
+                if root is None:
+                    root = elem
+                if event != 'end':
+                    continue
+                if elem.tag == f'{OPENSEARCH_NAMESPACE}totalResults':
+                    self.total_results = int(elem.text)
+                elif elem.tag == f'{ATOM_NAMESPACE}entry':
+                    yield self.parse_entry(elem)
+                    root.clear()
 
-        # Send the request and parse the response
-        data = urllib.request.urlopen(url)
-        data_parsed = data.read().decode('utf-8')
-        xml_data_parsed = ET.fromstring(data_parsed)
+    def urlopen_with_retry(self, url):
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.wait()
+            try:
+                #times the request up to the response headers - parsing is streamed as entries are consumed downstream
+                with im.timer("arxiv.request"):
+                    return urllib.request.urlopen(url)
+            except urllib.error.HTTPError as e:
+                #only rate limit (429) and server errors - arXiv answers 503 when overloaded - are worth retrying
+                if attempt == self.max_retries or (e.code != 429 and e.code < 500):
+                    raise
+                e.close()
+                backoff = min(64, 2 ** attempt) + random.uniform(0, 1)
+                im.incr("arxiv.retries")
+                print(f"arXiv request failed ({e.code}), retrying in {backoff:.1f}s")
+                time.sleep(backoff)
 
+    def parse_entry(self, entry):
         # Extract the article data
-        articles = []
-        for entry in xml_data_parsed.findall('{http://www.w3.org/2005/Atom}entry'):
-            title = entry.find('{http://www.w3.org/2005/Atom}title')
-            published = entry.find('{http://www.w3.org/2005/Atom}published')
-            updated = entry.find('{http://www.w3.org/2005/Atom}updated')
-            summary = entry.find('{http://www.w3.org/2005/Atom}summary')
-            link = entry.find('{http://www.w3.org/2005/Atom}link[@type="text/html"][@rel="alternate"][@href]')
-
-            article = {
-                'title': title.text,
-                'published': published.text,
-                'updated': updated.text,
-                'summary': summary.text,
-                'link': link.get('href')
-            }
-
-            articles.append(article)
-        
-        return articles
\ No newline at end of file
+        title = entry.find(f'{ATOM_NAMESPACE}title')
+        published = entry.find(f'{ATOM_NAMESPACE}published')
+        updated = entry.find(f'{ATOM_NAMESPACE}updated')
+        summary = entry.find(f'{ATOM_NAMESPACE}summary')
+        link = entry.find(f'{ATOM_NAMESPACE}link[@type="text/html"][@rel="alternate"][@href]')
+        doi = entry.find(f'{ARXIV_NAMESPACE}doi')
+
+        article = Article(
+            title=title.text,
+            abstract=summary.text,
+            published=published.text,
+            link=link.get('href'),
+            source='Arxiv',
+            doi=doi.text if doi is not None else '',
+            updated=updated.text
+        )
+
+        return article
@@ -0,0 +1,124 @@
+#historical backfill - fetches (and optionally scores) years of results into a local parquet store instead of the sheet
+#e.g. python backfill.py --start-date 2021/01/01 --end-date 2023/12/31 --window-days 30 --workers 4 --output-dir backfill
+#requires pandas and pyarrow in addition to requirements.txt
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+import os
+import re
+import article_consolidator as ac
+from article import Article
+from rate_limiter import RateLimiter
+import relevance_model as rm
+
+def make_date_windows(start_date, end_date, window_days):
+    #inclusive YYYY/MM/DD windows covering start_date to end_date
+    windows = []
+    window_start = datetime.strptime(start_date, '%Y/%m/%d')
+    last_date = datetime.strptime(end_date, '%Y/%m/%d')
+    while window_start <= last_date:
+        window_end = min(window_start + timedelta(days=window_days - 1), last_date)
+        windows.append((window_start.strftime('%Y/%m/%d'), window_end.strftime('%Y/%m/%d')))
+        window_start = window_end + timedelta(days=1)
+    return windows
+
+def make_part_filepath(output_dir, query, source, window):
+    query_slug = re.sub(r'[^0-9a-z]+', '_', query.casefold()).strip('_')
+    return os.path.join(output_dir, f'source={source}', f'query={query_slug}', f"{window[0].replace('/', '')}_{window[1].replace('/', '')}.parquet")
+
+def init_worker(n_workers):
+    #each process gets an equal share of every source's rate limit so the pool as a whole stays within it
+    for source, rate_limiter in ac.SOURCE_RATE_LIMITERS.items():
+        ac.SOURCE_RATE_LIMITERS[source] = RateLimiter(1 / (rate_limiter.min_interval * n_workers))
+
+def search_window(query, source, window, max_results, search_date):
+    #a window with more than max_results matches is split in half and each half searched, down to single days
+    #so a part file always holds every result of its window
+    article_consolidator = ac.ArticleConsolidator(query, max_results, min_date=window[0], max_date=window[1], search_date=search_date, search_sources=[source])
+    articles = article_consolidator.search_source(source)
+    if not article_consolidator.truncated.get(source):
+        return articles
+
+    window_start = datetime.strptime(window[0], '%Y/%m/%d')
+    window_end = datetime.strptime(window[1], '%Y/%m/%d')
+    if window_start == window_end:
+        #raised so the window is left unwritten and retried by the next run
+        raise RuntimeError(f"more than {max_results} results on {window[0]} - rerun with a higher --max-results")
+    first_end = window_start + timedelta(days=(window_end - window_start).days // 2)
+    print(f"Backfill: {source} '{query}' {window[0]}-{window[1]} has more than {max_results} results, splitting the window")
+    return (search_window(query, source, (window[0], first_end.strftime('%Y/%m/%d')), max_results, search_date)
+            + search_window(query, source, ((first_end + timedelta(days=1)).strftime('%Y/%m/%d'), window[1]), max_results, search_date))
+
+def run_window(query, source, window, max_results, part_filepath, relevance_model_filepath=None, relevance_model_encoder_filepath="sentence-transformers/all-MiniLM-L6-v2", relevance_fields=('title',), relevance_threshold=None, batch_size=32):
+    import pandas as pd
+
+    search_date = datetime.now().strftime("%d_%m_%Y_%H_%M_%S")
+    articles = search_window(query, source, window, max_results, search_date)
+
+    if relevance_model_filepath and articles:
+        #models are loaded once per worker process by the relevance_model registry
+        rm.predict_relevance(articles, relevance_model_filepath, relevance_model_encoder_filepath, batch_size=batch_size, fields=relevance_fields, threshold=relevance_threshold)
+
+    #written to a temporary file then renamed, so an existing part file always marks a completed window
+    os.makedirs(os.path.dirname(part_filepath), exist_ok=True)
+    tmp_filepath = part_filepath + '.tmp'
+    pd.DataFrame([article.to_dict() for article in articles], columns=list(Article.__slots__)).to_parquet(tmp_filepath, index=False)
+    os.replace(tmp_filepath, part_filepath)
+    return len(articles)
+
+def run_backfill(queries, sources, start_date, end_date, window_days=30, max_results=1000, workers=4, output_dir='backfill', relevance_model_filepath=None, relevance_model_encoder_filepath="sentence-transformers/all-MiniLM-L6-v2", relevance_fields=('title',), relevance_threshold=None):
+    tasks = []
+    for window in make_date_windows(start_date, end_date, window_days):
+        for query in queries:
+            for source in sources:
+                part_filepath = make_part_filepath(output_dir, query, source, window)
+                #resumable - windows already written by a previous run are skipped
+                if not os.path.exists(part_filepath):
+                    tasks.append((query, source, window, part_filepath))
+    print(f"Backfill: {len(tasks)} windows to fetch")
+
+    n_articles = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(workers,)) as executor:
+        futures = {
+            executor.submit(run_window, query, source, window, max_results, part_filepath, relevance_model_filepath, relevance_model_encoder_filepath, relevance_fields, relevance_threshold): (query, source, window)
+            for query, source, window, part_filepath in tasks
+        }
+        for future in as_completed(futures):
+            query, source, window = futures[future]
+            try:
+                n_window_articles = future.result()
+            except Exception as e:
+                #left unwritten so the next run retries it
+                print(f"Backfill failed for {source} '{query}' {window[0]}-{window[1]}: {e!r}")
+                continue
+            n_articles += n_window_articles
+            print(f"Backfill: {n_window_articles} articles for {source} '{query}' {window[0]}-{window[1]}")
+
+    print(f"Backfill: {n_articles} articles written to {output_dir}")
+    return n_articles
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", nargs="+", help="defaults to query_config queries in config.py")
+    parser.add_argument("--sources", nargs="+", default=ac.SOURCE_ORDER)
+    parser.add_argument("--start-date", required=True, help="YYYY/MM/DD")
+    parser.add_argument("--end-date", default=datetime.now().strftime('%Y/%m/%d'), help="YYYY/MM/DD")
+    parser.add_argument("--window-days", type=int, default=30)
+    parser.add_argument("--max-results", type=int, default=1000, help="per query, source and window")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--output-dir", default="backfill")
+    parser.add_argument("--relevance-model-path", help="score each window with this relevance model")
+    parser.add_argument("--relevance-model-encoder-path", default="sentence-transformers/all-MiniLM-L6-v2")
+    parser.add_argument("--relevance-fields", nargs="+", default=["title"], choices=rm.RELEVANCE_FIELDS, help="fields the relevance model was trained on")
+    parser.add_argument("--relevance-threshold", type=float, help="score with predict_proba >= threshold instead of predict")
+    args = parser.parse_args()
+
+    queries = args.queries
+    if queries is None:
+        import config as cf
+        queries = cf.query_config["queries"]
+
+    run_backfill(queries, args.sources, args.start_date, args.end_date, window_days=args.window_days, max_results=args.max_results,
+                 workers=args.workers, output_dir=args.output_dir, relevance_model_filepath=args.relevance_model_path,
+                 relevance_model_encoder_filepath=args.relevance_model_encoder_path, relevance_fields=tuple(args.relevance_fields),
+                 relevance_threshold=args.relevance_threshold)
@@ -0,0 +1,225 @@
+#end to end offline benchmark of lambda_handler against local fake PubMed, arXiv, OpenAI and google sheets services
+#run from repo root before a deploy e.g. python -m benchmarks.e2e --scales 10 100 1000 10000 --latency-ms 20 --error-rate 0.01
+#each scale runs in a fresh process so peak RSS is per run - exits non-zero if any threshold is exceeded
+import argparse
+import json
+import math
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import types
+
+BENCHMARK_QUERIES = ["large language model evaluation", "ChatGPT for healthcare"]
+BENCHMARK_SOURCES = ["pubmed", "arxiv"]
+BENCHMARK_TAB = "benchmark"
+#fraction of each query's PubMed results already in the sheet, so dedup has work to do
+EXISTING_FRACTION = 0.1
+SINK_FLUSH_SIZE = 50
+
+#limits checked after each scale - roughly 3x a run without injected latency or errors, tune from a known good run and tighten over time
+#runs with --relevance-model-path load torch / onnxruntime so need a --thresholds file with higher RSS limits
+#calls are checked against the expected number of requests for the scale (plus one retry per injected error) times max_call_ratio
+DEFAULT_THRESHOLDS = {
+    "max_wall_s": {"10": 15, "100": 15, "1000": 30, "10000": 120},
+    "max_peak_rss_mb": {"10": 250, "100": 250, "1000": 250, "10000": 300},
+    "max_call_ratio": 1.0
+}
+
+def results_per_search(n_articles):
+    return math.ceil(n_articles / (len(BENCHMARK_QUERIES) * len(BENCHMARK_SOURCES)))
+
+def expected_calls(n_articles, n_accepted, arxiv_page_size=100, pubmed_chunk_size=200):
+    #requests a correct run needs - one esearch plus efetch chunks per PubMed query, one request per arXiv page,
+    #one chat completion per accepted article and one sheet read per column plus one append per flush
+    max_results = results_per_search(n_articles)
+    n_queries = len(BENCHMARK_QUERIES)
+    return {
+        "pubmed": n_queries * (1 + math.ceil(max_results / pubmed_chunk_size)),
+        "arxiv": n_queries * math.ceil(max_results / arxiv_page_size),
+        "openai": n_accepted,
+        "sheet": 2 + max(1, math.ceil(n_accepted / SINK_FLUSH_SIZE))
+    }
+
+def make_existing_rows(max_results):
+    from article import Article, SHEET_COLUMNS
+    from benchmarks.fake_services import make_title
+    rows = [SHEET_COLUMNS]
+    for query in BENCHMARK_QUERIES:
+        for idx in range(int(max_results * EXISTING_FRACTION)):
+            rows.append(Article(title=make_title(query, idx), source='PubMed', query=query).to_row())
+    return rows
+
+def make_config(n_articles, sheet_backend, relevance_model_path=None, encoder_path=None):
+    #stands in for the deployment's config.py
+    config = types.ModuleType("config")
+    config.query_config = {
+        "queries": BENCHMARK_QUERIES,
+        "topic_checks": ["clinical evaluation", "patient safety"],
+        "max_results": results_per_search(n_articles),
+        "search_sources": BENCHMARK_SOURCES
+    }
+    config.llm_config = {
+        "run_topic_check": True,
+        "run_relevance_model": relevance_model_path is not None,
+        "run_relevance_model_path": relevance_model_path,
+        "run_relevance_model_encoder_path": encoder_path or "sentence-transformers/all-MiniLM-L6-v2",
+        #quotas of the fake endpoint rather than the account, so the limiter does not dominate the timing
+        "requests_per_minute": 1000000,
+        "tokens_per_minute": 100000000
+    }
+    config.setup_config = {
+        "credentials_key_path": "",
+        "gsheet_key": "",
+        "gsheet_tab_name": BENCHMARK_TAB,
+        "target_col_num": 1,
+        "sheet_backend": sheet_backend
+    }
+    config.pipeline_config = {"sink_flush_size": SINK_FLUSH_SIZE}
+    return config
+
+def run_worker(args):
+    #child process - drives lambda_handler once against the fake services named in the environment
+    import article_consolidator as ac
+    from benchmarks.fake_services import FaultySheetBackend
+    import instrumentation as im
+    from rate_limiter import RateLimiter
+
+    max_results = results_per_search(args.worker)
+    existing_rows = make_existing_rows(max_results)
+    sheet_backend = FaultySheetBackend({BENCHMARK_TAB: existing_rows}, latency_s=args.latency_ms / 1000, error_rate=args.error_rate)
+    sys.modules["config"] = make_config(args.worker, sheet_backend, args.relevance_model_path, args.encoder_path)
+
+    if not args.real_rate_limits:
+        #the fake servers have no quota - keep the limiters in the code path without their waits
+        for source in ac.SOURCE_RATE_LIMITERS:
+            ac.SOURCE_RATE_LIMITERS[source] = RateLimiter(100000)
+
+    import app
+    start = time.perf_counter()
+    app.lambda_handler({"source": "benchmark"}, None)
+    wall_s = time.perf_counter() - start
+
+    result = {
+        "n_articles": args.worker,
+        "wall_s": round(wall_s, 3),
+        #ru_maxrss is in KB on linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "rows_written": len(sheet_backend.tabs[BENCHMARK_TAB]) - len(existing_rows),
+        "sheet": sheet_backend.stats(),
+        "run_report": im.run_report()
+    }
+    with open(args.result_path, "w") as f:
+        json.dump(result, f)
+
+def run_scale(n_articles, services, args):
+    env = dict(
+        os.environ,
+        PUBMED_BASE_URL=services["pubmed"].base_url,
+        ARXIV_BASE_URL=services["arxiv"].base_url + "api/query?",
+        OPENAI_API_BASE=services["openai"].api_base,
+        OPENAI_API_KEY="benchmark"
+    )
+    for service in services.values():
+        service.reset_counts()
+
+    with tempfile.TemporaryDirectory() as dirpath:
+        result_path = os.path.join(dirpath, "result.json")
+        #the sheet backend lives in the worker process, so it is only given an error rate when selected
+        sheet_error_rate = args.error_rate if "sheet" in args.services_with_errors else 0
+        command = [sys.executable, "-m", "benchmarks.e2e", "--worker", str(n_articles), "--result-path", result_path,
+                   "--latency-ms", str(args.latency_ms), "--error-rate", str(sheet_error_rate)]
+        if args.real_rate_limits:
+            command.append("--real-rate-limits")
+        if args.relevance_model_path:
+            command += ["--relevance-model-path", args.relevance_model_path, "--encoder-path", args.encoder_path]
+        completed = subprocess.run(command, env=env, stdout=None if args.verbose else subprocess.DEVNULL)
+        if completed.returncode != 0:
+            return {"n_articles": n_articles, "failed": True, "returncode": completed.returncode}
+        with open(result_path) as f:
+            result = json.load(f)
+
+    result["services"] = {name: service.stats() for name, service in services.items()}
+    result["services"]["sheet"] = result.pop("sheet")
+    return result
+
+def check_thresholds(result, thresholds):
+    if result.get("failed"):
+        return [f"run failed with exit code {result['returncode']}"]
+
+    failures = []
+    scale = str(result["n_articles"])
+    max_wall_s = thresholds["max_wall_s"].get(scale)
+    if max_wall_s is not None and result["wall_s"] > max_wall_s:
+        failures.append(f"wall time {result['wall_s']}s > {max_wall_s}s")
+    max_peak_rss_mb = thresholds["max_peak_rss_mb"].get(scale)
+    if max_peak_rss_mb is not None and result["peak_rss_mb"] > max_peak_rss_mb:
+        failures.append(f"peak RSS {result['peak_rss_mb']}MB > {max_peak_rss_mb}MB")
+
+    n_accepted = result["run_report"]["counters"].get("articles.accepted", 0)
+    for service, n_expected in expected_calls(result["n_articles"], n_accepted).items():
+        service_stats = result["services"][service]
+        max_calls = (n_expected + service_stats["errors"]) * thresholds["max_call_ratio"]
+        if service_stats["total_calls"] > max_calls:
+            failures.append(f"{service} calls {service_stats['total_calls']} > {max_calls:.0f}")
+    return failures
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scales", type=int, nargs="+", default=[10, 100, 1000, 10000], help="approximate articles fetched per run")
+    parser.add_argument("--latency-ms", type=float, default=0, help="added to every fake service request")
+    parser.add_argument("--error-rate", type=float, default=0, help="fraction of requests answered with an error")
+    parser.add_argument("--services-with-errors", nargs="+", default=["openai", "sheet"], choices=["pubmed", "arxiv", "openai", "sheet"],
+                        help="errors are only injected into these services")
+    parser.add_argument("--real-rate-limits", action="store_true", help="keep the production per-source rate limits")
+    parser.add_argument("--relevance-model-path", help="also run the relevance model stage")
+    parser.add_argument("--encoder-path", default="sentence-transformers/all-MiniLM-L6-v2")
+    parser.add_argument("--thresholds", help="JSON file overriding DEFAULT_THRESHOLDS")
+    parser.add_argument("--output", help="write all results to this JSON file")
+    parser.add_argument("--verbose", action="store_true", help="show the agent's own output")
+    parser.add_argument("--worker", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--result-path", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker is not None:
+        run_worker(args)
+        sys.exit(0)
+
+    from benchmarks.fake_services import FakeArxiv, FakeOpenAI, FakePubMed
+
+    thresholds = dict(DEFAULT_THRESHOLDS)
+    if args.thresholds:
+        with open(args.thresholds) as f:
+            thresholds.update(json.load(f))
+
+    latency_s = args.latency_ms / 1000
+    services = {
+        "pubmed": FakePubMed(latency_s=latency_s, error_rate=args.error_rate if "pubmed" in args.services_with_errors else 0, error_status=429).start(),
+        "arxiv": FakeArxiv(latency_s=latency_s, error_rate=args.error_rate if "arxiv" in args.services_with_errors else 0).start(),
+        "openai": FakeOpenAI(latency_s=latency_s, error_rate=args.error_rate if "openai" in args.services_with_errors else 0).start()
+    }
+    results = []
+    any_failures = False
+    try:
+        for n_articles in args.scales:
+            result = run_scale(n_articles, services, args)
+            result["threshold_failures"] = check_thresholds(result, thresholds)
+            results.append(result)
+            any_failures = any_failures or bool(result["threshold_failures"])
+
+            if result.get("failed"):
+                print(f"{n_articles:>6} articles: FAILED - {result['threshold_failures'][0]}")
+                continue
+            calls = ", ".join(f"{name} {service_stats['total_calls']}" for name, service_stats in result["services"].items())
+            status = "ok" if not result["threshold_failures"] else "FAILED - " + "; ".join(result["threshold_failures"])
+            print(f"{n_articles:>6} articles: {result['wall_s']:>8.2f}s  peak RSS {result['peak_rss_mb']:>7.1f}MB  calls: {calls}  {status}")
+    finally:
+        for service in services.values():
+            service.stop()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    sys.exit(1 if any_failures else 0)
@@ -0,0 +1,256 @@
+#local stand-ins for PubMed E-utilities, the arXiv API, the OpenAI chat endpoint and google sheets
+#responses follow the shape of recorded E-utilities XML / arXiv Atom feeds, generated deterministically per query so any scale can be served
+#every service counts its calls and can inject latency and errors
+import http.server
+import json
+import random
+import threading
+import time
+import urllib.parse
+import zlib
+from xml.sax.saxutils import escape
+import gspread
+import requests
+from utils import InMemorySheetBackend
+
+ABSTRACT_SENTENCES = [
+    'Large language models are increasingly evaluated on clinical question answering tasks.',
+    'We report accuracy, calibration and failure modes across several benchmark datasets.',
+    'Menopause symptoms including hot flushes and sleep disturbance were assessed in a prospective cohort.',
+    'Results suggest that retrieval augmentation improves factual consistency.',
+    'Limitations include small sample sizes and the absence of external validation.'
+]
+
+def make_title(query, idx):
+    return f'{query.capitalize()} study {idx}: evidence from a synthetic benchmark corpus'
+
+def make_abstract(query, idx, n_sentences=8):
+    rng = random.Random(zlib.crc32(f'{query}|{idx}'.encode('utf-8')))
+    return ' '.join(rng.choice(ABSTRACT_SENTENCES) for _ in range(n_sentences))
+
+class FakeServiceHandler(http.server.BaseHTTPRequestHandler):
+    #keep-alive so pooled requests.Session connections are reused as they would be against the real APIs
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.service.handle(self)
+
+    def do_POST(self):
+        self.server.service.handle(self)
+
+    def log_message(self, format, *args):
+        pass
+
+class FakeService:
+    #threaded local HTTP server - subclasses implement respond(path, params, body) -> (status, content_type, payload)
+    def __init__(self, latency_s=0.0, error_rate=0.0, error_status=503, seed=42):
+        self.latency_s = latency_s
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.errors = 0
+        #statuses returned, in order, before any other response - for tests that need an exact error sequence
+        self.error_statuses = []
+        self.server = None
+
+    def start(self):
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), FakeServiceHandler)
+        self.server.daemon_threads = True
+        self.server.service = self
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self.server.server_address[1]}/'
+
+    def reset_counts(self):
+        with self.lock:
+            self.calls = {}
+            self.errors = 0
+
+    def handle(self, handler):
+        parsed = urllib.parse.urlparse(handler.path)
+        params = {key: values[0] for key, values in urllib.parse.parse_qs(parsed.query).items()}
+        content_length = int(handler.headers.get('Content-Length') or 0)
+        body = handler.rfile.read(content_length) if content_length else b''
+        endpoint = parsed.path.rstrip('/').rsplit('/', 1)[-1]
+
+        with self.lock:
+            self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+            error_status = self.error_statuses.pop(0) if self.error_statuses else None
+            inject_error = error_status is not None or self.rng.random() < self.error_rate
+            if inject_error:
+                self.errors += 1
+
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        if inject_error:
+            status, content_type, payload = self.error_response()
+            status = error_status or status
+        else:
+            status, content_type, payload = self.respond(parsed.path, params, body)
+
+        handler.send_response(status)
+        handler.send_header('Content-Type', content_type)
+        handler.send_header('Content-Length', str(len(payload)))
+        handler.end_headers()
+        handler.wfile.write(payload)
+
+    def error_response(self):
+        return self.error_status, 'text/plain', b'injected error'
+
+    def respond(self, path, params, body):
+        raise NotImplementedError
+
+    def stats(self):
+        with self.lock:
+            return {"calls": dict(self.calls), "total_calls": sum(self.calls.values()), "errors": self.errors}
+
+class FakePubMed(FakeService):
+    #esearch.fcgi returns retmax IDs per term, efetch.fcgi a PubmedArticleSet for the requested IDs
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.id_queries = {}
+
+    def respond(self, path, params, body):
+        if path.endswith('esearch.fcgi'):
+            return self.esearch(params)
+        if path.endswith('efetch.fcgi'):
+            return self.efetch(params)
+        return 404, 'text/plain', b'not found'
+
+    def esearch(self, params):
+        query = params.get('term', '')
+        retmax = int(params.get('retmax', 20))
+        #each term gets its own block of IDs so results never overlap between queries
+        id_offset = (zlib.crc32(query.encode('utf-8')) % 1000) * 1000000
+        ids = [str(id_offset + idx) for idx in range(retmax)]
+        with self.lock:
+            self.id_queries[id_offset] = query
+        id_list = ''.join(f'<Id>{pmid}</Id>' for pmid in ids)
+        payload = f'<?xml version="1.0" encoding="UTF-8" ?>\n<eSearchResult><Count>{retmax}</Count><RetMax>{retmax}</RetMax><RetStart>0</RetStart><IdList>{id_list}</IdList></eSearchResult>'
+        return 200, 'text/xml', payload.encode('utf-8')
+
+    def efetch(self, params):
+        articles = []
+        for pmid in params.get('id', '').split(','):
+            if not pmid:
+                continue
+            id_offset, idx = divmod(int(pmid), 1000000)
+            query = self.id_queries.get(id_offset * 1000000, 'unknown')
+            articles.append(
+                '<PubmedArticle><MedlineCitation Status="MEDLINE" Owner="NLM">'
+                f'<PMID Version="1">{pmid}</PMID>'
+                '<Article PubModel="Print-Electronic"><Journal><JournalIssue CitedMedium="Internet">'
+                f'<PubDate><Year>2023</Year><Month>{idx % 12 + 1:02d}</Month><Day>{idx % 28 + 1:02d}</Day></PubDate>'
+                '</JournalIssue></Journal>'
+                f'<ArticleTitle>{escape(make_title(query, idx))}</ArticleTitle>'
+                f'<Abstract><AbstractText>{escape(make_abstract(query, idx))}</AbstractText></Abstract>'
+                '</Article></MedlineCitation>'
+                f'<PubmedData><ArticleIdList><ArticleId IdType="pubmed">{pmid}</ArticleId><ArticleId IdType="doi">10.9999/fake.{pmid}</ArticleId></ArticleIdList></PubmedData>'
+                '</PubmedArticle>'
+            )
+        payload = '<?xml version="1.0" ?>\n<PubmedArticleSet>' + ''.join(articles) + '</PubmedArticleSet>'
+        return 200, 'text/xml', payload.encode('utf-8')
+
+    def error_response(self):
+        #E-utilities returns a JSON error body when the request rate is exceeded
+        return self.error_status, 'application/json', b'{"error":"API rate limit exceeded","count":"4"}'
+
+class FakeArxiv(FakeService):
+    #Atom feed paged by start / max_results, newest updated first, with total_results matches per query
+    def __init__(self, total_results=100000, **kwargs):
+        super().__init__(**kwargs)
+        self.total_results = total_results
+
+    def respond(self, path, params, body):
+        query = params.get('search_query', '').split(' AND ')[0].replace('all:', '', 1)
+        start = int(params.get('start', 0))
+        max_results = int(params.get('max_results', 10))
+        query_offset = zlib.crc32(query.encode('utf-8')) % 1000
+        entries = []
+        for idx in range(start, min(start + max_results, self.total_results)):
+            arxiv_id = f'{2300 + query_offset % 100}.{idx:05d}'
+            #one second older per result so results are in lastUpdatedDate descending order
+            updated = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(1700000000 - idx))
+            entries.append(
+                f'<entry><id>http://arxiv.org/abs/{arxiv_id}v1</id><updated>{updated}</updated><published>{updated}</published>'
+                f'<title>{escape(make_title(query, idx))}</title><summary>{escape(make_abstract(query, idx))}</summary>'
+                f'<link href="http://arxiv.org/abs/{arxiv_id}v1" rel="alternate" type="text/html"/>'
+                f'<arxiv:doi>10.48550/arXiv.{arxiv_id}</arxiv:doi></entry>'
+            )
+        payload = (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<feed xmlns="http://www.w3.org/2005/Atom" xmlns:opensearch="http://a9.com/-/spec/opensearch/1.1/" xmlns:arxiv="http://arxiv.org/schemas/atom">'
+            f'<opensearch:totalResults>{self.total_results}</opensearch:totalResults>'
+            f'<opensearch:startIndex>{start}</opensearch:startIndex><opensearch:itemsPerPage>{max_results}</opensearch:itemsPerPage>'
+            + ''.join(entries) + '</feed>'
+        )
+        return 200, 'application/atom+xml', payload.encode('utf-8')
+
+class FakeOpenAI(FakeService):
+    #chat completions endpoint - answers the topic mention prompt "Yes: ..." or "No" deterministically per prompt
+    def __init__(self, error_status=429, **kwargs):
+        super().__init__(error_status=error_status, **kwargs)
+
+    @property
+    def api_base(self):
+        return self.base_url + 'v1'
+
+    def respond(self, path, params, body):
+        if not path.endswith('chat/completions'):
+            return 404, 'application/json', b'{"error": {"message": "not found", "type": "invalid_request_error"}}'
+        request = json.loads(body or b'{}')
+        prompt = ''.join(message.get('content', '') for message in request.get('messages', []))
+        content = 'Yes: Menopause symptoms were assessed.' if zlib.crc32(prompt.encode('utf-8')) % 3 == 0 else 'No'
+        prompt_tokens = len(prompt) // 4
+        completion_tokens = len(content) // 4
+        response = {
+            "id": f"chatcmpl-{zlib.crc32(prompt.encode('utf-8'))}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "gpt-3.5-turbo"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+        }
+        return 200, 'application/json', json.dumps(response).encode('utf-8')
+
+    def error_response(self):
+        return self.error_status, 'application/json', b'{"error": {"message": "Rate limit reached (injected)", "type": "requests"}}'
+
+class FaultySheetBackend(InMemorySheetBackend):
+    #in-memory sheet with latency and quota (429) errors raised as gspread would, counting reads and appends
+    def __init__(self, tabs=None, latency_s=0.0, error_rate=0.0, seed=42):
+        super().__init__(tabs)
+        self.latency_s = latency_s
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.read_calls = 0
+        self.errors = 0
+
+    def col_values(self, gsheet_tab_name, tgt_col_num):
+        self.read_calls += 1
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        return super().col_values(gsheet_tab_name, tgt_col_num)
+
+    def values_append(self, gsheet_tab_name, rows):
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        if self.rng.random() < self.error_rate:
+            self.errors += 1
+            response = requests.Response()
+            response.status_code = 429
+            response._content = b'{"error": {"code": 429, "message": "Quota exceeded (injected)", "status": "RESOURCE_EXHAUSTED"}}'
+            raise gspread.exceptions.APIError(response)
+        return super().values_append(gsheet_tab_name, rows)
+
+    def stats(self):
+        return {"calls": {"col_values": self.read_calls, "values_append": self.append_calls}, "total_calls": self.read_calls + self.append_calls, "errors": self.errors}
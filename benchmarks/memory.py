@@ -0,0 +1,62 @@
+#memory benchmark - per-article footprint of the previous dict records vs Article
+#run from repo root e.g. python -m benchmarks.memory --n-articles 100000
+import argparse
+import tracemalloc
+from article import Article
+
+def make_fields(i):
+    return {
+        'title': f'Evaluating large language models for clinical question answering {i}',
+        'abstract': 'Large language models have shown promise in answering clinical questions. ' * 3 + str(i),
+        'published': '2023-12-06',
+        'link': f'https://pubmed.ncbi.nlm.nih.gov/{38000000 + i}',
+        'doi': f'10.1000/{i}'
+    }
+
+def build_dicts(n_articles, query):
+    #previous flow - parser dict copied into a consolidated dict, with the 'PubMed' literal and the run's query string shared by every article
+    articles = []
+    for i in range(n_articles):
+        raw_article = make_fields(i)
+        articles.append({
+            'Title': raw_article['title'],
+            'Abstract': raw_article['abstract'],
+            'Published': raw_article['published'],
+            'Link': raw_article['link'],
+            'Source': 'PubMed',
+            'Query': query,
+            'SearchDate': '06_12_2023_09_00_00',
+            'Category': "N/A",
+            'DOI': raw_article['doi'],
+            'Topic Check': 'N/A',
+            'Topic Check Query': 'N/A',
+            'Relevant_pred': 'TBD'
+        })
+    return articles
+
+def build_records(n_articles, query):
+    articles = []
+    for i in range(n_articles):
+        article = Article(source='PubMed', **make_fields(i))
+        article.set_query(query, '06_12_2023_09_00_00')
+        article.topic_check, article.topic_check_query, article.relevant_pred = 'N/A', 'N/A', 'TBD'
+        articles.append(article)
+    return articles
+
+def measure(build, n_articles, query):
+    tracemalloc.start()
+    articles = build(n_articles, query)
+    current_bytes, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del articles
+    return current_bytes, peak_bytes
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n-articles", type=int, default=100000)
+    args = parser.parse_args()
+
+    query = "large language model evaluation"
+    for name, build in [("dict", build_dicts), ("Article", build_records)]:
+        current_bytes, peak_bytes = measure(build, args.n_articles, query)
+        print(f"{name:>8}: {current_bytes / args.n_articles:.0f} bytes/article retained, peak {peak_bytes / 1e6:.1f} MB")
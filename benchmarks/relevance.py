@@ -0,0 +1,63 @@
+#benchmark per-article cost of the relevance model step
+#run from repo root e.g. python -m benchmarks.relevance --model-path pa_lr_model_we_2023_12_06.pkl
+import argparse
+import pickle
+import time
+from sentence_transformers import SentenceTransformer
+from article import Article
+import relevance_model as rm
+from utils import parse_relevance_pred
+
+def make_articles(n_articles):
+    return [Article(title=f'Evaluating large language models for clinical question answering {i}') for i in range(n_articles)]
+
+def run_per_article_load(articles, model_path, encoder_path):
+    #previous behaviour - models re-loaded for every article
+    for article in articles:
+        relevance_model = pickle.load(open(model_path, 'rb'))
+        encoder = SentenceTransformer(encoder_path)
+        title_vector = encoder.encode(article.title)
+        article.relevant_pred = parse_relevance_pred(relevance_model.predict(title_vector.reshape(1, -1)))
+
+def run_registry(articles, model_path, encoder_path):
+    for article in articles:
+        rm.predict_relevance([article], model_path, encoder_path)
+
+def run_batched(articles, model_path, encoder_path, batch_size=32):
+    rm.predict_relevance(articles, model_path, encoder_path, batch_size=batch_size)
+
+def throughput(fn, n_titles, model_path, encoder_path):
+    articles = make_articles(n_titles)
+    start = time.perf_counter()
+    fn(articles, model_path, encoder_path)
+    return n_titles / (time.perf_counter() - start)
+
+def time_per_article(fn, articles, model_path, encoder_path):
+    start = time.perf_counter()
+    fn(articles, model_path, encoder_path)
+    return (time.perf_counter() - start) / len(articles)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model-path", required=True)
+    parser.add_argument("--encoder-path", default="sentence-transformers/all-MiniLM-L6-v2")
+    parser.add_argument("--n-articles", type=int, default=20)
+    parser.add_argument("--throughput-sizes", type=int, nargs="+", default=[10, 100, 1000])
+    args = parser.parse_args()
+
+    articles = make_articles(args.n_articles)
+
+    before = time_per_article(run_per_article_load, articles, args.model_path, args.encoder_path)
+    print(f"Per-article load:  {before * 1000:.1f} ms/article")
+
+    #first call includes the one-off load, subsequent calls are warm
+    after = time_per_article(run_registry, articles, args.model_path, args.encoder_path)
+    print(f"Registry (cold):   {after * 1000:.1f} ms/article")
+    after_warm = time_per_article(run_registry, articles, args.model_path, args.encoder_path)
+    print(f"Registry (warm):   {after_warm * 1000:.1f} ms/article")
+
+    #throughput with warm models - one article per call vs one batched call
+    for n_titles in args.throughput_sizes:
+        single = throughput(run_registry, n_titles, args.model_path, args.encoder_path)
+        batched = throughput(run_batched, n_titles, args.model_path, args.encoder_path)
+        print(f"{n_titles:>5} titles: per-article {single:.1f} titles/s, batched {batched:.1f} titles/s")
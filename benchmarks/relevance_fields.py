@@ -0,0 +1,67 @@
+#benchmark CPU latency per 100 articles of title-only vs abstract-aware relevance scoring
+#a logistic regression is fitted on random labels for each feature set, so no trained model file is needed
+#run from repo root e.g. python -m benchmarks.relevance_fields --encoder-path models/encoder_onnx --max-abstract-chars 500 1000 2000
+import argparse
+import os
+import pickle
+import tempfile
+import time
+import numpy as np
+from sklearn.linear_model import LogisticRegression
+from article import Article
+import relevance_model as rm
+
+FIELD_SETS = [('title',), ('title', 'abstract'), ('title', 'abstract', 'query')]
+
+ABSTRACT_SENTENCE = 'We evaluated large language models on clinical question answering across several benchmark datasets and report accuracy, calibration and failure modes. '
+
+def make_articles(n_articles, abstract_sentences=12):
+    #~1800 character abstracts, typical of PubMed, with a handful of repeated queries
+    return [
+        Article(
+            title=f'Evaluating large language models for clinical question answering {i}',
+            abstract=f'Study {i}. ' + ABSTRACT_SENTENCE * abstract_sentences,
+            query=['large language model evaluation', 'ChatGPT for healthcare', 'menopause symptoms'][i % 3]
+        )
+        for i in range(n_articles)
+    ]
+
+def make_model_file(encoder, fields, dirpath):
+    dim = np.asarray(encoder.encode(['dim probe'])).shape[1]
+    rng = np.random.default_rng(42)
+    model = LogisticRegression().fit(rng.standard_normal((20, dim * len(fields))), np.arange(20) % 2)
+    model_filepath = os.path.join(dirpath, f"model_{'_'.join(fields)}.pkl")
+    with open(model_filepath, 'wb') as f:
+        pickle.dump(model, f)
+    return model_filepath
+
+def ms_per_100(articles, model_filepath, encoder_path, fields, max_abstract_chars, batch_size, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        rm.predict_relevance(articles, model_filepath, encoder_path, batch_size=batch_size, fields=fields, threshold=0.5, max_abstract_chars=max_abstract_chars)
+        timings.append(time.perf_counter() - start)
+    return min(timings) / len(articles) * 100 * 1000
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--encoder-path", default="sentence-transformers/all-MiniLM-L6-v2")
+    parser.add_argument("--n-articles", type=int, default=100)
+    parser.add_argument("--max-abstract-chars", type=int, nargs="+", default=[500, 1000, 2000])
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    encoder = rm.get_encoder(args.encoder_path)
+    articles = make_articles(args.n_articles)
+
+    with tempfile.TemporaryDirectory() as dirpath:
+        for fields in FIELD_SETS:
+            model_filepath = make_model_file(encoder, fields, dirpath)
+            #warm up so the one-off model load is not timed
+            rm.predict_relevance(articles[:1], model_filepath, args.encoder_path, fields=fields, threshold=0.5)
+            #abstract truncation only matters when the abstract is a feature
+            for max_abstract_chars in (args.max_abstract_chars if 'abstract' in fields else [None]):
+                latency = ms_per_100(articles, model_filepath, args.encoder_path, fields, max_abstract_chars, args.batch_size, args.repeats)
+                truncation = f"{max_abstract_chars} chars" if max_abstract_chars is not None else "-"
+                print(f"{'+'.join(fields):<20} abstract {truncation:<11} {latency:.0f} ms / 100 articles")
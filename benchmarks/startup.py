@@ -0,0 +1,39 @@
+#cold start benchmark - import time and time to first prediction, each measured in a fresh interpreter
+#run from repo root e.g. python -m benchmarks.startup --model-path models/relevance_model.pkl --encoder-path models/encoder_onnx
+import argparse
+import json
+import subprocess
+import sys
+
+STARTUP_SCRIPT = """
+import json, time
+start = time.perf_counter()
+import pipeline
+import_seconds = time.perf_counter() - start
+
+start = time.perf_counter()
+import relevance_model as rm
+from article import Article
+rm.predict_relevance([Article(title='Large language models for clinical decision support')], {model_path!r}, {encoder_path!r})
+first_prediction_seconds = time.perf_counter() - start
+
+print(json.dumps({{"import_seconds": import_seconds, "first_prediction_seconds": first_prediction_seconds}}))
+"""
+
+def measure_startup(model_path, encoder_path):
+    script = STARTUP_SCRIPT.format(model_path=model_path, encoder_path=encoder_path)
+    output = subprocess.run([sys.executable, "-c", script], check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model-path", required=True)
+    parser.add_argument("--encoder-path", nargs="+", default=["sentence-transformers/all-MiniLM-L6-v2"], help="one or more encoders e.g. models/encoder models/encoder_onnx")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    for encoder_path in args.encoder_path:
+        results = [measure_startup(args.model_path, encoder_path) for _ in range(args.repeats)]
+        import_seconds = min(result["import_seconds"] for result in results)
+        first_prediction_seconds = min(result["first_prediction_seconds"] for result in results)
+        print(f"{encoder_path}: import {import_seconds:.2f}s, time to first prediction {first_prediction_seconds:.2f}s")
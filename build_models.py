@@ -0,0 +1,68 @@
+#build step run inside the container image so the lambda never downloads or converts models on a cold start
+#e.g. python build_models.py --output-dir models --relevance-model pa_lr_model_we_2023_12_06.pkl --onnx --quantize
+import argparse
+import os
+import pickle
+from sentence_transformers import SentenceTransformer
+from relevance_model import ONNX_MODEL_FILENAME
+
+def save_encoder(encoder_name, encoder_dirpath):
+    encoder = SentenceTransformer(encoder_name)
+    encoder.save(encoder_dirpath)
+    print("Saved encoder to ", encoder_dirpath)
+    return encoder
+
+def save_relevance_model(relevance_model_filepath, output_filepath):
+    #re-serialised with the highest pickle protocol, which loads faster
+    with open(relevance_model_filepath, 'rb') as f:
+        relevance_model = pickle.load(f)
+    with open(output_filepath, 'wb') as f:
+        pickle.dump(relevance_model, f, protocol=pickle.HIGHEST_PROTOCOL)
+    print("Saved relevance model to ", output_filepath)
+
+def export_onnx_encoder(encoder, onnx_dirpath, quantize=False):
+    #exports the transformer only - mean pooling and normalisation are done in relevance_model.OnnxEncoder
+    import torch
+    os.makedirs(onnx_dirpath, exist_ok=True)
+    transformer = encoder[0].auto_model
+    transformer.eval()
+    tokenizer = encoder.tokenizer
+    tokenizer.save_pretrained(onnx_dirpath)
+
+    sample_inputs = tokenizer(["example title"], return_tensors="pt")
+    onnx_filepath = os.path.join(onnx_dirpath, ONNX_MODEL_FILENAME)
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            (sample_inputs["input_ids"], sample_inputs["attention_mask"], sample_inputs["token_type_ids"]),
+            onnx_filepath,
+            input_names=["input_ids", "attention_mask", "token_type_ids"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={name: {0: "batch", 1: "sequence"} for name in ["input_ids", "attention_mask", "token_type_ids", "last_hidden_state"]},
+            opset_version=14
+        )
+
+    if quantize:
+        #int8 weights - roughly 4x smaller and faster on CPU for a small loss in embedding accuracy
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantized_filepath = onnx_filepath + ".quant"
+        quantize_dynamic(onnx_filepath, quantized_filepath, weight_type=QuantType.QInt8)
+        os.replace(quantized_filepath, onnx_filepath)
+
+    print("Saved ONNX encoder to ", onnx_dirpath)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--encoder", default="sentence-transformers/all-MiniLM-L6-v2")
+    parser.add_argument("--output-dir", default="models")
+    parser.add_argument("--relevance-model", help="pickled relevance model to bake into the image")
+    parser.add_argument("--onnx", action="store_true", help="also export the encoder for the onnxruntime backend")
+    parser.add_argument("--quantize", action="store_true", help="int8 quantise the ONNX encoder")
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    encoder = save_encoder(args.encoder, os.path.join(args.output_dir, "encoder"))
+    if args.relevance_model:
+        save_relevance_model(args.relevance_model, os.path.join(args.output_dir, "relevance_model.pkl"))
+    if args.onnx:
+        export_onnx_encoder(encoder, os.path.join(args.output_dir, "encoder_onnx"), quantize=args.quantize)
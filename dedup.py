@@ -0,0 +1,207 @@
+import hashlib
+import re
+import numpy as np
+import instrumentation as im
+
+#identifiers parsed from the article links written to the sheet
+PUBMED_LINK_REGEX = re.compile(r'pubmed\.ncbi\.nlm\.nih\.gov/(\d+)')
+ARXIV_LINK_REGEX = re.compile(r'arxiv\.org/abs/([^\s?#]+?)(v\d+)?$')
+
+def normalize_title(title):
+    #casefold and collapse whitespace so trivially different spellings of a title share a key
+    return " ".join(str(title).casefold().split())
+
+def hash_key(prefix, value):
+    return hashlib.blake2b(f'{prefix}:{value}'.encode('utf-8'), digest_size=16).digest()
+
+def article_keys(title, link='', doi=''):
+    keys = []
+    if title:
+        normalized_title = normalize_title(title)
+        if normalized_title:
+            keys.append(hash_key('title', normalized_title))
+    if doi:
+        keys.append(hash_key('doi', doi.strip().casefold()))
+    if link:
+        pubmed_match = PUBMED_LINK_REGEX.search(link)
+        if pubmed_match:
+            keys.append(hash_key('pmid', pubmed_match.group(1)))
+        arxiv_match = ARXIV_LINK_REGEX.search(link.strip())
+        if arxiv_match:
+            keys.append(hash_key('arxiv', arxiv_match.group(1)))
+    return keys
+
+class DedupIndex:
+    #O(1) lookup of articles already in the sheet or already accepted earlier in the run
+    #an article is a duplicate if any of its title, DOI, PubMed ID or arXiv ID keys has been seen
+    def __init__(self):
+        self.keys = set()
+
+    @classmethod
+    def from_sheet_values(cls, titles, links=[]):
+        dedup_index = cls()
+        for idx, title in enumerate(titles):
+            link = links[idx] if idx < len(links) else ''
+            dedup_index.keys.update(article_keys(title, link))
+        return dedup_index
+
+    def contains(self, article):
+        return any(key in self.keys for key in article_keys(article.title, article.link, article.doi))
+
+    def add(self, article):
+        self.keys.update(article_keys(article.title, article.link, article.doi))
+
+    def __len__(self):
+        return len(self.keys)
+
+#near-duplicate detection - catches a preprint and its published version, or titles differing in punctuation
+#both indexes bucket titles with locality sensitive hashing so a lookup only compares against a few candidates
+#rather than every historical title, and only candidates above the similarity threshold count as duplicates
+NON_ALPHANUMERIC_REGEX = re.compile(r'[^0-9a-z ]+')
+MINHASH_PRIME = (1 << 31) - 1
+
+def near_duplicate_text(title):
+    return " ".join(NON_ALPHANUMERIC_REGEX.sub(' ', normalize_title(title)).split())
+
+class MinHashLSHIndex:
+    #encoder-free mode - jaccard similarity of character shingles estimated with minhash signatures
+    def __init__(self, threshold=0.8, num_perm=64, bands=16, shingle_size=5, seed=42):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(seed)
+        self.perm_a = rng.integers(1, MINHASH_PRIME, size=num_perm, dtype=np.uint64)
+        self.perm_b = rng.integers(0, MINHASH_PRIME, size=num_perm, dtype=np.uint64)
+        self.signatures = []
+        self.buckets = [{} for _ in range(bands)]
+
+    def signature(self, title):
+        text = near_duplicate_text(title)
+        if len(text) <= self.shingle_size:
+            shingles = {text}
+        else:
+            shingles = {text[i:i + self.shingle_size] for i in range(len(text) - self.shingle_size + 1)}
+        shingle_hashes = np.array([int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=4).digest(), 'little') for shingle in shingles], dtype=np.uint64)
+        return ((self.perm_a[:, None] * shingle_hashes[None, :] + self.perm_b[:, None]) % MINHASH_PRIME).min(axis=1)
+
+    def band_keys(self, signature):
+        return [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+
+    def find(self, title):
+        #returns the index of the most similar stored title above the threshold, or None
+        signature = self.signature(title)
+        candidates = set()
+        for band, band_key in enumerate(self.band_keys(signature)):
+            candidates.update(self.buckets[band].get(band_key, []))
+        best_idx, best_similarity = None, self.threshold
+        for candidate_idx in candidates:
+            similarity = float(np.mean(self.signatures[candidate_idx] == signature))
+            if similarity >= best_similarity:
+                best_idx, best_similarity = candidate_idx, similarity
+        return best_idx
+
+    def add_many(self, titles):
+        for title in titles:
+            signature = self.signature(title)
+            idx = len(self.signatures)
+            self.signatures.append(signature)
+            for band, band_key in enumerate(self.band_keys(signature)):
+                self.buckets[band].setdefault(band_key, []).append(idx)
+
+    def filter_articles(self, articles):
+        #drops near duplicates of stored titles and of articles earlier in the list, adding the kept ones
+        kept_articles = []
+        for article in articles:
+            if not article.title or self.find(article.title) is None:
+                kept_articles.append(article)
+                if article.title:
+                    self.add_many([article.title])
+            else:
+                im.incr("articles.near_duplicate")
+        return kept_articles
+
+class EmbeddingLSHIndex:
+    #encoder mode - cosine similarity of SentenceTransformer title embeddings, bucketed with random hyperplanes
+    def __init__(self, encoder, threshold=0.9, num_tables=8, num_bits=12, batch_size=32, seed=42, embedding_store=None):
+        self.encoder = encoder
+        self.threshold = threshold
+        self.num_tables = num_tables
+        self.num_bits = num_bits
+        self.batch_size = batch_size
+        self.seed = seed
+        #optional embedding_store.EmbeddingStore so sheet titles seen in earlier runs are not re-encoded
+        self.embedding_store = embedding_store
+        #drawn on the first encoded vector, so the dimension always matches the encoder output
+        self.hyperplanes = None
+        self.vectors = []
+        self.buckets = [{} for _ in range(num_tables)]
+
+    def encode(self, titles):
+        if self.embedding_store is not None:
+            vectors = self.embedding_store.encode(titles, self.encoder, batch_size=self.batch_size)
+        else:
+            vectors = self.encoder.encode(list(titles), batch_size=self.batch_size)
+        vectors = np.asarray(vectors, dtype=np.float32)
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+    def table_keys(self, vector):
+        if self.hyperplanes is None:
+            rng = np.random.default_rng(self.seed)
+            self.hyperplanes = rng.standard_normal((self.num_tables, self.num_bits, vector.shape[0])).astype(np.float32)
+        return [np.packbits(table_planes @ vector > 0).tobytes() for table_planes in self.hyperplanes]
+
+    def find_vector(self, vector):
+        candidates = set()
+        for table, table_key in enumerate(self.table_keys(vector)):
+            candidates.update(self.buckets[table].get(table_key, []))
+        best_idx, best_similarity = None, self.threshold
+        for candidate_idx in candidates:
+            similarity = float(self.vectors[candidate_idx] @ vector)
+            if similarity >= best_similarity:
+                best_idx, best_similarity = candidate_idx, similarity
+        return best_idx
+
+    def add_vector(self, vector):
+        idx = len(self.vectors)
+        self.vectors.append(vector)
+        for table, table_key in enumerate(self.table_keys(vector)):
+            self.buckets[table].setdefault(table_key, []).append(idx)
+
+    def find(self, title):
+        return self.find_vector(self.encode([title])[0])
+
+    def add_many(self, titles):
+        titles = [title for title in titles if title]
+        if len(titles) == 0:
+            return
+        for vector in self.encode(titles):
+            self.add_vector(vector)
+
+    def filter_articles(self, articles):
+        #encodes the whole list in one batch, then checks each article against stored and earlier kept titles
+        titled_articles = [article for article in articles if article.title]
+        vectors = self.encode([article.title for article in titled_articles]) if titled_articles else []
+        article_vectors = {id(article): vector for article, vector in zip(titled_articles, vectors)}
+
+        kept_articles = []
+        for article in articles:
+            vector = article_vectors.get(id(article))
+            if vector is None or self.find_vector(vector) is None:
+                kept_articles.append(article)
+                if vector is not None:
+                    self.add_vector(vector)
+            else:
+                im.incr("articles.near_duplicate")
+        return kept_articles
+
+def make_near_duplicate_index(mode, threshold=None, encoder=None, embedding_store=None):
+    #mode is "minhash" (no encoder needed) or "embedding" (reuses the relevance model's SentenceTransformer)
+    if mode == "minhash":
+        return MinHashLSHIndex() if threshold is None else MinHashLSHIndex(threshold=threshold)
+    elif mode == "embedding":
+        if threshold is None:
+            return EmbeddingLSHIndex(encoder, embedding_store=embedding_store)
+        return EmbeddingLSHIndex(encoder, threshold=threshold, embedding_store=embedding_store)
+    raise ValueError(f"Unknown near duplicate mode: {mode}")
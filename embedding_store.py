@@ -0,0 +1,129 @@
+import json
+import os
+import re
+import threading
+import numpy as np
+from dedup import hash_key, normalize_title
+
+EMBEDDINGS_FILENAME = 'embeddings.f32'
+IDS_FILENAME = 'ids.bin'
+META_FILENAME = 'meta.json'
+#blake2b digest size used by dedup.hash_key
+KEY_SIZE = 16
+
+def make_text_key(text):
+    #casefolded / whitespace collapsed text so trivially different copies of a title or abstract share one row
+    return hash_key('text', normalize_title(text))
+
+class EmbeddingStore:
+    #persistent text -> embedding cache shared by the training notebook and predict_relevance, so each text is encoded once
+    #one directory per encoder version: embeddings.f32 is an append-only float32 matrix read through np.memmap
+    #and ids.bin holds the matching 16 byte text key for each row
+    #appends are not coordinated across processes, so only one process should write to a store at a time
+    def __init__(self, store_dirpath, encoder_id):
+        self.encoder_id = encoder_id
+        #e.g. sentence-transformers/all-MiniLM-L6-v2 -> sentence_transformers_all_minilm_l6_v2
+        encoder_slug = re.sub(r'[^0-9a-z]+', '_', encoder_id.casefold()).strip('_')
+        self.dirpath = os.path.join(store_dirpath, encoder_slug)
+        self.embeddings_filepath = os.path.join(self.dirpath, EMBEDDINGS_FILENAME)
+        self.ids_filepath = os.path.join(self.dirpath, IDS_FILENAME)
+        self.meta_filepath = os.path.join(self.dirpath, META_FILENAME)
+        #guards key_rows, embeddings and the counters - shared by the topic check workers and the relevance stage
+        self.lock = threading.Lock()
+        self.dim = None
+        self.key_rows = {}
+        self.embeddings = np.zeros((0, 0), dtype=np.float32)
+        self.hits = 0
+        self.misses = 0
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.meta_filepath):
+            return
+        with open(self.meta_filepath) as f:
+            meta = json.load(f)
+        if meta['encoder_id'] != self.encoder_id:
+            raise ValueError(f"Embedding store {self.dirpath} was built with encoder {meta['encoder_id']}, not {self.encoder_id}")
+        self.dim = meta['dim']
+
+        with open(self.ids_filepath, 'rb') as f:
+            ids = f.read()
+        #embeddings are written before their ids, so a partially written append leaves extra rows that are ignored
+        n_rows = min(len(ids) // KEY_SIZE, os.path.getsize(self.embeddings_filepath) // (self.dim * 4))
+        self.key_rows = {ids[row * KEY_SIZE:(row + 1) * KEY_SIZE]: row for row in range(n_rows)}
+        self.map_embeddings(n_rows)
+
+    def map_embeddings(self, n_rows):
+        if n_rows == 0:
+            self.embeddings = np.zeros((0, self.dim), dtype=np.float32)
+        else:
+            self.embeddings = np.memmap(self.embeddings_filepath, dtype=np.float32, mode='r', shape=(n_rows, self.dim))
+
+    def __len__(self):
+        with self.lock:
+            return len(self.key_rows)
+
+    def __contains__(self, text):
+        key = make_text_key(text)
+        with self.lock:
+            return key in self.key_rows
+
+    def get_many(self, texts):
+        #(len(texts), dim) matrix of stored embeddings - raises KeyError for any text not in the store
+        #row lookup and matrix are read together under the lock so a concurrent append can never hand out a row past the mapped end
+        keys = [make_text_key(text) for text in texts]
+        with self.lock:
+            rows = [self.key_rows[key] for key in keys]
+            embeddings = self.embeddings
+        return np.asarray(embeddings[rows])
+
+    def append(self, texts, embeddings):
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        with self.lock:
+            new_keys = {}
+            for text, embedding in zip(texts, embeddings):
+                key = make_text_key(text)
+                if key not in self.key_rows and key not in new_keys:
+                    new_keys[key] = embedding
+            if not new_keys:
+                return
+
+            if self.dim is None:
+                self.dim = embeddings.shape[1]
+                os.makedirs(self.dirpath, exist_ok=True)
+                with open(self.meta_filepath, 'w') as f:
+                    json.dump({'encoder_id': self.encoder_id, 'dim': self.dim}, f)
+            elif embeddings.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {embeddings.shape[1]} does not match store dimension {self.dim}")
+
+            with open(self.embeddings_filepath, 'ab') as f:
+                f.write(np.stack(list(new_keys.values())).tobytes())
+            with open(self.ids_filepath, 'ab') as f:
+                f.write(b''.join(new_keys.keys()))
+
+            #remap before publishing the new keys, so any visible key always has its row in the mapped matrix
+            n_rows = len(self.key_rows)
+            self.map_embeddings(n_rows + len(new_keys))
+            for row, key in enumerate(new_keys, start=n_rows):
+                self.key_rows[key] = row
+
+    def encode(self, texts, encoder, batch_size=32):
+        #embeddings for texts in order - only texts not already in the store are sent to the encoder, then appended
+        texts = [str(text) for text in texts]
+        missing_key_texts = {}
+        with self.lock:
+            for text in texts:
+                key = make_text_key(text)
+                if key not in self.key_rows and key not in missing_key_texts:
+                    missing_key_texts[key] = text
+            missing_texts = list(missing_key_texts.values())
+            self.misses += len(missing_texts)
+            self.hits += len(texts) - len(missing_texts)
+        #encoded outside the lock - two threads may encode the same new text, append keeps only the first copy
+        if missing_texts:
+            self.append(missing_texts, encoder.encode(missing_texts, batch_size=batch_size))
+        return self.get_many(texts)
+
+    def stats(self):
+        with self.lock:
+            return {"rows": len(self.key_rows), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,112 @@
+import cProfile
+from contextlib import contextmanager
+import functools
+import io
+import os
+import pstats
+import threading
+import time
+
+#run-wide timers and counters shared by every module - reset at the start of each run since warm lambda invocations reuse the process
+#names are "<area>.<what>" e.g. "pubmed.esearch", "llm.prompt_tokens"
+_lock = threading.Lock()
+_timers = {}
+_counters = {}
+_profilers = []
+_profile_enabled = False
+
+def reset(profile=False):
+    global _profile_enabled
+    with _lock:
+        _timers.clear()
+        _counters.clear()
+        _profilers.clear()
+        _profile_enabled = profile
+
+def record_time(name, seconds):
+    with _lock:
+        timer_stats = _timers.setdefault(name, {"count": 0, "total_s": 0.0, "max_s": 0.0})
+        timer_stats["count"] += 1
+        timer_stats["total_s"] += seconds
+        timer_stats["max_s"] = max(timer_stats["max_s"], seconds)
+
+@contextmanager
+def timer(name):
+    #e.g. with timer("sheet.append"): ...
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_time(name, time.perf_counter() - start)
+
+def timed(name):
+    #decorator form of timer e.g. @timed("relevance.predict")
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timer(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def incr(name, amount=1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+@contextmanager
+def profiled():
+    #cProfile only sees the thread that enabled it, so each pipeline worker thread is profiled separately and merged in the report
+    if not _profile_enabled:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        with _lock:
+            _profilers.append(profiler)
+
+def write_profile(profile_path, top_n=25):
+    #dumps the merged profile for snakeviz / pstats and returns the top functions by cumulative time
+    with _lock:
+        profilers = list(_profilers)
+    if not profilers:
+        return None
+    stats = pstats.Stats(profilers[0])
+    for profiler in profilers[1:]:
+        stats.add(profiler)
+    stats.dump_stats(profile_path)
+    summary = io.StringIO()
+    stats.stream = summary
+    stats.sort_stats("cumulative").print_stats(top_n)
+    return summary.getvalue()
+
+def run_report(**extra):
+    with _lock:
+        report = {
+            "timers": {name: {"count": timer_stats["count"], "total_s": round(timer_stats["total_s"], 3), "max_s": round(timer_stats["max_s"], 3)} for name, timer_stats in sorted(_timers.items())},
+            "counters": dict(sorted(_counters.items()))
+        }
+    report.update(extra)
+    return report
+
+def emf_record(report, namespace, dimensions=None):
+    #CloudWatch embedded metric format - a log line lambda turns into metrics without any API calls
+    #https://docs.aws.amazon.com/AmazonCloudWatch/latest/monitoring/CloudWatch_Embedded_Metric_Format_Specification.html
+    dimensions = dimensions if dimensions is not None else {"FunctionName": os.getenv("AWS_LAMBDA_FUNCTION_NAME", "paper-agent")}
+    metrics = []
+    record = dict(dimensions)
+    for name, timer_stats in report["timers"].items():
+        metrics.append({"Name": f"{name}.ms", "Unit": "Milliseconds"})
+        record[f"{name}.ms"] = round(timer_stats["total_s"] * 1000, 1)
+    for name, value in report["counters"].items():
+        metrics.append({"Name": name, "Unit": "Count"})
+        record[name] = value
+    record["_aws"] = {
+        "Timestamp": int(time.time() * 1000),
+        #a single directive is limited to 100 metrics
+        "CloudWatchMetrics": [{"Namespace": namespace, "Dimensions": [list(dimensions)], "Metrics": metrics[:100]}]
+    }
+    return record
@@ -1,35 +1,187 @@
+import hashlib
+import json
 import os
+import random
+import sqlite3
+import threading
+import time
 import openai
+import instrumentation as im
+from rate_limiter import TokenBucket
+
+#errors worth retrying - rate limits, timeouts and server side failures
+RETRYABLE_ERRORS = (
+    openai.error.RateLimitError,
+    openai.error.ServiceUnavailableError,
+    openai.error.APIConnectionError,
+    openai.error.Timeout,
+    openai.error.APIError
+)
+
+class LLMResponseCache:
+    #persistent cache of deterministic (temperature=0) responses keyed on model, system prompt and user prompt
+    #backed by a single sqlite file so it can live on EFS or be copied to / from S3 between runs
+    def __init__(self, cache_path, ttl_seconds=30 * 24 * 60 * 60, max_entries=100000, access_batch_size=100):
+        self.cache_path = cache_path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        #hits only record their access time in memory - written with the next put / eviction, every access_batch_size hits or on flush
+        self.access_batch_size = access_batch_size
+        self.pending_accesses = {}
+        self.hits = 0
+        self.misses = 0
+        self.n_rows = 0
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(cache_path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response TEXT, created_at REAL, accessed_at REAL)"
+        )
+        #indexes so the expiry and eviction deletes do not scan and sort the whole table
+        self.connection.execute("CREATE INDEX IF NOT EXISTS responses_created_at ON responses (created_at)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+        with self.lock:
+            self.evict()
+            self.connection.commit()
+
+    def make_key(self, model, system_prompt, message):
+        return hashlib.sha256(json.dumps([model, system_prompt, message]).encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            row = self.connection.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                self.misses += 1
+                im.incr("llm.cache_misses")
+                return None
+            self.pending_accesses[key] = now
+            if len(self.pending_accesses) >= self.access_batch_size:
+                self.write_accesses()
+                self.connection.commit()
+            self.hits += 1
+            im.incr("llm.cache_hits")
+            return row[0]
+
+    def put(self, key, response):
+        now = time.time()
+        with self.lock:
+            self.write_accesses()
+            self.connection.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)", (key, response, now, now))
+            #n_rows over counts replaced keys, which only brings the next eviction forward
+            self.n_rows += 1
+            if self.n_rows > self.max_entries:
+                self.evict()
+            self.connection.commit()
+
+    def evict(self):
+        #called with the lock held - expire old entries then evict least recently used down to max_entries less a batch,
+        #so the deletes run once per batch of puts rather than on every put
+        self.write_accesses()
+        now = time.time()
+        self.connection.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+        self.n_rows = self.connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        if self.n_rows > self.max_entries:
+            keep_entries = self.max_entries - max(1, self.max_entries // 10)
+            self.connection.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (keep_entries,)
+            )
+            self.n_rows = keep_entries
+
+    def write_accesses(self):
+        #called with the lock held - the caller commits
+        if self.pending_accesses:
+            self.connection.executemany("UPDATE responses SET accessed_at = ? WHERE key = ?", [(accessed_at, key) for key, accessed_at in self.pending_accesses.items()])
+            self.pending_accesses = {}
+
+    def flush(self):
+        with self.lock:
+            self.write_accesses()
+            self.connection.commit()
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
 
 class LLMReviewer:
-    def __init__(self, system_prompt):
+    def __init__(self, system_prompt, model="gpt-3.5-turbo", requests_per_minute=3500, tokens_per_minute=90000, max_retries=5, api_base=None, cache=None):
         # Setting the API key to use the OpenAI API - requires presetting in local env
         openai.api_key = os.getenv("OPENAI_API_KEY")
         self.system_prompt = system_prompt
         self.messages = [
             {"role": "system", "content": self.system_prompt},
         ]
+        self.model = model
+        #limits are per reviewer, so share one reviewer across a run to keep within the account's quota
+        self.request_limiter = TokenBucket(requests_per_minute)
+        self.token_limiter = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        #optional OpenAI-compatible endpoint e.g. a local fake server for testing
+        self.api_base = api_base or os.getenv("OPENAI_API_BASE")
+        #optional LLMResponseCache - responses are deterministic so identical prompts are only paid for once
+        self.cache = cache
 
     def chat_without_memory(self, message):
         self.messages.append({"role": "user", "content": message})
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=[
-            {"role": "system", "content": self.system_prompt},
-            {"role": "user", "content": message},
-        ],
-            temperature=0
-        )
-        self.messages.append({"role": "assistant", "content": response["choices"][0]["message"].content})
-        return response["choices"][0]["message"]["content"]
+        response_content = self.review(message)
+        self.messages.append({"role": "assistant", "content": response_content})
+        return response_content
 
     def chat_with_memory(self, message):
         self.messages.append({"role": "user", "content": message})
         #NOTE: context length is the big problem here and also very expensive
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=self.messages,
-            temperature=0
-        )
+        response = self.create_completion(self.messages)
         self.messages.append({"role": "assistant", "content": response["choices"][0]["message"].content})
-        return response["choices"][0]["message"]["content"]
\ No newline at end of file
+        return response["choices"][0]["message"]["content"]
+
+    @im.timed("llm.review")
+    def review(self, message):
+        #single stateless review - safe to call from multiple threads
+        if self.cache is not None:
+            cache_key = self.cache.make_key(self.model, self.system_prompt, message)
+            cached_response = self.cache.get(cache_key)
+            if cached_response is not None:
+                return cached_response
+
+        response = self.create_completion([
+            {"role": "system", "content": self.system_prompt},
+            {"role": "user", "content": message},
+        ])
+        response_content = response["choices"][0]["message"]["content"]
+
+        if self.cache is not None:
+            self.cache.put(cache_key, response_content)
+        return response_content
+
+    def create_completion(self, messages):
+        #rough token estimate (~4 characters per token) used to stay under the tokens/min limit
+        estimated_tokens = sum(len(message["content"]) for message in messages) // 4
+        extra_params = {"api_base": self.api_base} if self.api_base else {}
+
+        for attempt in range(self.max_retries + 1):
+            self.request_limiter.acquire(1)
+            self.token_limiter.acquire(estimated_tokens)
+            try:
+                with im.timer("llm.request"):
+                    response = openai.ChatCompletion.create(
+                        model=self.model,
+                        messages=messages,
+                        temperature=0,
+                        **extra_params
+                    )
+                im.incr("llm.calls")
+                usage = response.get("usage") or {}
+                im.incr("llm.prompt_tokens", usage.get("prompt_tokens", 0))
+                im.incr("llm.completion_tokens", usage.get("completion_tokens", 0))
+                return response
+            except RETRYABLE_ERRORS as e:
+                #APIError covers every status code, only retry rate limits and server errors
+                http_status = getattr(e, "http_status", None)
+                if isinstance(e, openai.error.APIError) and http_status is not None and http_status != 429 and http_status < 500:
+                    raise
+                if attempt == self.max_retries:
+                    raise
+                #exponential backoff with jitter
+                backoff = min(60, 2 ** attempt) + random.uniform(0, 1)
+                im.incr("llm.retries")
+                print(f"LLM request failed ({e.__class__.__name__}), retrying in {backoff:.1f}s")
+                time.sleep(backoff)
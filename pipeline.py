@@ -0,0 +1,398 @@
+import json
+import queue
+import threading
+import time
+import article_consolidator as ac
+from dedup import DedupIndex, make_near_duplicate_index
+import instrumentation as im
+import llm_reviewer as lr
+import relevance_model as rm
+from topic_prefilter import TopicPrefilter
+from article import SHEET_COLUMNS
+from utils import GSpreadBackend, SheetStore
+from watermark_store import WatermarkStore
+
+LLM_SYSTEM_PROMPT = "You are an expert scientific reviewer that reviews and summarises scientific text in an unbiased, scholarly tone"
+
+LLM_TOPIC_MENTION_PROMPT_TEMPLATE = """ 
+
+                Does the abstract below mention {topic}?
+
+                If the answer is yes, please respond with "Yes: <Example sentence that mentions topic>"
+                If the answer is no, please respond with "No"
+
+                {abstract}
+
+                """
+
+#marks the end of a stage's input
+STOP = object()
+
+class PipelineStopped(Exception):
+    #raised by emit once another stage has failed, so a producer such as a paging search stops instead of fetching items that would be dropped
+    pass
+
+class Stage:
+    #process(item, emit) handles one input item and calls emit for each output item
+    #finish(emit) is called once after the last item, e.g. to flush a partial batch
+    def __init__(self, name, process, workers=1, queue_size=100, finish=None):
+        self.name = name
+        self.process = process
+        self.workers = workers
+        self.finish = finish
+        #bounded so a fast upstream stage blocks rather than buffering the whole run in memory
+        self.input_queue = queue.Queue(maxsize=queue_size)
+        self.active_workers = workers
+        self.lock = threading.Lock()
+
+class ReorderBuffer:
+    #releases items tagged (task_idx, seq) in task order, then seq order within a task, whatever order they arrive in
+    #so a single worker stage downstream of concurrent producers (e.g. dedup after the searches) decides the same way every run
+    def __init__(self, n_tasks):
+        self.n_tasks = n_tasks
+        self.pending = {}
+        self.task_sizes = {}
+        self.next_task = 0
+        self.next_seq = 0
+
+    def add(self, task_idx, seq, item):
+        self.pending.setdefault(task_idx, {})[seq] = item
+        return self.release()
+
+    def finish_task(self, task_idx, n_items):
+        self.task_sizes[task_idx] = n_items
+        return self.release()
+
+    def release(self):
+        released = []
+        while self.next_task < self.n_tasks:
+            task_items = self.pending.get(self.next_task, {})
+            if self.next_seq in task_items:
+                released.append(task_items.pop(self.next_seq))
+                self.next_seq += 1
+            elif self.task_sizes.get(self.next_task) == self.next_seq:
+                self.pending.pop(self.next_task, None)
+                self.next_task += 1
+                self.next_seq = 0
+            else:
+                break
+        return released
+
+class Pipeline:
+    #runs stages concurrently connected by bounded queues, so network-bound and CPU-bound work overlap
+    def __init__(self, stages):
+        self.stages = stages
+        self.stop_event = threading.Event()
+        self.errors = []
+
+    def put(self, target_queue, item):
+        #blocks while the downstream queue is full (backpressure) - raises PipelineStopped once another stage has failed
+        while not self.stop_event.is_set():
+            try:
+                target_queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+        raise PipelineStopped()
+
+    def get(self, source_queue):
+        while not self.stop_event.is_set():
+            try:
+                return source_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return STOP
+
+    def run_worker(self, stage, next_stage):
+        if next_stage is not None:
+            emit = lambda item: self.put(next_stage.input_queue, item)
+        else:
+            emit = lambda item: None
+
+        try:
+            with im.profiled():
+                while True:
+                    item = self.get(stage.input_queue)
+                    if item is STOP:
+                        break
+                    #includes any time blocked emitting to a full downstream queue
+                    with im.timer(f"stage.{stage.name}"):
+                        stage.process(item, emit)
+
+            with stage.lock:
+                stage.active_workers -= 1
+                is_last_worker = stage.active_workers == 0
+            #the last worker out finishes the stage and tells every downstream worker to stop
+            if is_last_worker and not self.stop_event.is_set():
+                if stage.finish is not None:
+                    with im.timer(f"stage.{stage.name}"):
+                        stage.finish(emit)
+                if next_stage is not None:
+                    for _ in range(next_stage.workers):
+                        self.put(next_stage.input_queue, STOP)
+        except PipelineStopped:
+            pass
+        except Exception as e:
+            print(f"Pipeline stage {stage.name} failed: {e!r}")
+            self.errors.append(e)
+            self.stop_event.set()
+
+    def run(self, items):
+        threads = []
+        for stage_idx, stage in enumerate(self.stages):
+            next_stage = self.stages[stage_idx + 1] if stage_idx + 1 < len(self.stages) else None
+            for worker_idx in range(stage.workers):
+                thread = threading.Thread(target=self.run_worker, args=(stage, next_stage), name=f'{stage.name}-{worker_idx}', daemon=True)
+                thread.start()
+                threads.append(thread)
+
+        first_stage = self.stages[0]
+        try:
+            for item in items:
+                self.put(first_stage.input_queue, item)
+            for _ in range(first_stage.workers):
+                self.put(first_stage.input_queue, STOP)
+        except PipelineStopped:
+            pass
+
+        for thread in threads:
+            thread.join()
+
+        if self.errors:
+            raise self.errors[0]
+
+def run_paper_agent(cf, search_date):
+    #daily run: search -> normalize -> dedup -> LLM check -> relevance -> sink
+    queries = cf.query_config["queries"]
+    queries_topic_checks = cf.query_config["topic_checks"]
+    max_results = cf.query_config["max_results"]
+    search_sources = cf.query_config["search_sources"]
+    near_duplicate_mode = cf.query_config.get("near_duplicate_mode")
+    near_duplicate_threshold = cf.query_config.get("near_duplicate_threshold")
+    watermark_path = cf.query_config.get("watermark_path")
+
+    run_topic_check = cf.llm_config["run_topic_check"]
+    run_relevance_model = cf.llm_config["run_relevance_model"]
+    relevance_model_filepath = cf.llm_config["run_relevance_model_path"]
+    relevance_batch_size = cf.llm_config.get("run_relevance_model_batch_size", 32)
+    #artifacts from train_relevance.py record the encoder, fields, threshold and abstract length they were trained with - config overrides them
+    relevance_metadata = rm.get_relevance_metadata(relevance_model_filepath) if run_relevance_model else {}
+    relevance_model_encoder_filepath = cf.llm_config.get("run_relevance_model_encoder_path", relevance_metadata.get("encoder_id", "sentence-transformers/all-MiniLM-L6-v2"))
+    if relevance_metadata.get("encoder_id") not in (None, relevance_model_encoder_filepath):
+        #expected for a baked or ONNX copy of the same encoder, otherwise the model is scoring embeddings it was not trained on
+        print(f"Relevance model was trained with encoder {relevance_metadata['encoder_id']}, running with {relevance_model_encoder_filepath}")
+    #fields the model was trained on - the v1 model uses titles only, abstract-aware models e.g. ["title", "abstract", "query"]
+    relevance_fields = tuple(cf.llm_config.get("run_relevance_model_fields", relevance_metadata.get("fields", ["title"])))
+    #set to score with predict_proba >= threshold instead of the model's hard predict
+    relevance_threshold = cf.llm_config.get("run_relevance_model_threshold", relevance_metadata.get("threshold"))
+    relevance_max_abstract_chars = cf.llm_config.get("run_relevance_model_max_abstract_chars", relevance_metadata.get("max_abstract_chars", 1000))
+    embedding_store_path = cf.llm_config.get("embedding_store_path")
+    #defaults to the encoder path - set explicitly when a path is reused for a different encoder build
+    embedding_store_encoder_id = cf.llm_config.get("embedding_store_encoder_id", relevance_model_encoder_filepath)
+    llm_requests_per_minute = cf.llm_config.get("requests_per_minute", 3500)
+    llm_tokens_per_minute = cf.llm_config.get("tokens_per_minute", 90000)
+    llm_max_workers = cf.llm_config.get("max_workers", 8)
+    llm_cache_path = cf.llm_config.get("cache_path")
+    llm_cache_ttl_days = cf.llm_config.get("cache_ttl_days", 30)
+    llm_cache_max_entries = cf.llm_config.get("cache_max_entries", 100000)
+    #optional cascade in front of the LLM e.g. {"min_abstract_chars": 100, "synonyms": {...}, "reject_threshold": 0.15}
+    topic_prefilter_config = cf.llm_config.get("topic_prefilter")
+
+    pipeline_config = getattr(cf, "pipeline_config", {})
+    queue_size = pipeline_config.get("queue_size", 100)
+    normalize_workers = pipeline_config.get("normalize_workers", 1)
+    #rows are written to the sheet every sink_flush_size articles so a late failure keeps earlier work
+    sink_flush_size = pipeline_config.get("sink_flush_size", 50)
+    #optional cProfile of every pipeline thread, dumped to this path e.g. /tmp/paper_agent.prof
+    profile_path = pipeline_config.get("profile_path")
+    #optional CloudWatch namespace - the run report is also printed as an embedded metric format line
+    emf_namespace = pipeline_config.get("emf_namespace")
+
+    run_start = time.perf_counter()
+    im.reset(profile=profile_path is not None)
+
+    credentials_key_path = cf.setup_config["credentials_key_path"]
+    gsheet_key = cf.setup_config["gsheet_key"]
+    gsheet_tab_name = cf.setup_config["gsheet_tab_name"]
+    tgt_col_num = cf.setup_config["target_col_num"]
+    link_col_num = cf.setup_config.get("link_col_num", SHEET_COLUMNS.index("Link") + 1)
+
+    #one authenticated client for the run - setup_config["sheet_backend"] can supply another backend e.g. utils.InMemorySheetBackend for offline benchmarks
+    sheet_backend = cf.setup_config.get("sheet_backend") or GSpreadBackend(gsheet_key, credentials_key_path)
+    sheet_store = SheetStore(sheet_backend, gsheet_tab_name)
+
+    #fetched once per run - titles, DOIs and PubMed / arXiv IDs accepted earlier in the run are added too
+    current_paper_titles, current_paper_links = sheet_store.get_col_lists([tgt_col_num, link_col_num])
+    dedup_index = DedupIndex.from_sheet_values(current_paper_titles, current_paper_links)
+
+    #optional near duplicate stage over historical and in-run titles e.g. an arXiv preprint and its PubMed version
+    near_duplicate_index = None
+    if near_duplicate_mode:
+        near_duplicate_encoder = None
+        near_duplicate_embedding_store = None
+        if near_duplicate_mode == "embedding":
+            near_duplicate_encoder = rm.get_encoder(relevance_model_encoder_filepath)
+            #sheet titles are seeded through the embedding store, so only titles added since the last run are encoded
+            near_duplicate_embedding_store = rm.get_embedding_store(embedding_store_path, embedding_store_encoder_id) if embedding_store_path else None
+        near_duplicate_index = make_near_duplicate_index(near_duplicate_mode, near_duplicate_threshold, near_duplicate_encoder, near_duplicate_embedding_store)
+        near_duplicate_index.add_many(current_paper_titles)
+
+    #incremental mode - per (query, source) watermarks limit searches to items newer than the last successful run
+    watermark_store = WatermarkStore(watermark_path) if watermark_path else None
+
+    #optional persistent title embeddings shared with training (see embedding_store.py) so seen titles are not re-encoded
+    embedding_store = rm.get_embedding_store(embedding_store_path, embedding_store_encoder_id) if run_relevance_model and embedding_store_path else None
+
+    llm_cache = None
+    if run_topic_check:
+        #responses are cached across runs when a cache path (e.g. on EFS) is configured
+        llm_cache = lr.LLMResponseCache(llm_cache_path, ttl_seconds=llm_cache_ttl_days * 24 * 60 * 60, max_entries=llm_cache_max_entries) if llm_cache_path else None
+        llm_agent = lr.LLMReviewer(LLM_SYSTEM_PROMPT, requests_per_minute=llm_requests_per_minute, tokens_per_minute=llm_tokens_per_minute, cache=llm_cache)
+
+    #answers short-abstract, keyword and clearly (dis)similar cases itself so only ambiguous articles are paid for
+    topic_prefilter = None
+    if run_topic_check and topic_prefilter_config is not None:
+        use_embeddings = topic_prefilter_config.get("reject_threshold") is not None or topic_prefilter_config.get("accept_threshold") is not None
+        topic_prefilter = TopicPrefilter(
+            min_abstract_chars=topic_prefilter_config.get("min_abstract_chars", 100),
+            synonyms=topic_prefilter_config.get("synonyms", {}),
+            encoder=rm.get_encoder(relevance_model_encoder_filepath) if use_embeddings else None,
+            reject_threshold=topic_prefilter_config.get("reject_threshold"),
+            accept_threshold=topic_prefilter_config.get("accept_threshold"),
+            embedding_store=rm.get_embedding_store(embedding_store_path, embedding_store_encoder_id) if use_embeddings and embedding_store_path else None
+        )
+
+    consolidators = [ac.ArticleConsolidator(query, max_results, min_date='2020/01/01', search_date=search_date, search_sources=search_sources, watermark_store=watermark_store) for query in queries]
+    sources = [source for source in ac.SOURCE_ORDER if source in search_sources]
+    #query order then SOURCE_ORDER - dedup sees results in this order, so the first query / PubMed copy of a duplicate is the one kept
+    search_tasks = [(query_idx, source) for query_idx in range(len(queries)) for source in sources]
+    dedup_order = ReorderBuffer(len(search_tasks))
+
+    def search(search_task, emit):
+        #emit raises PipelineStopped after a failure downstream, which closes the generator so no further pages are requested
+        task_idx, (query_idx, source) = search_task
+        n_articles = 0
+        for article in consolidators[query_idx].iter_source(source):
+            im.incr(f"articles.fetched.{source}")
+            emit((task_idx, n_articles, query_idx, source, article))
+            n_articles += 1
+        #marks the end of the task with its article count, as normalize workers may reorder items
+        emit((task_idx, n_articles, query_idx, source, None))
+
+    def normalize(item, emit):
+        task_idx, seq, query_idx, source, article = item
+        if article is not None:
+            article = consolidators[query_idx].normalize(source, article)
+        emit((task_idx, seq, query_idx, article))
+
+    def dedup(item, emit):
+        #searches run concurrently, so results are held back and deduplicated in search task order rather than arrival order
+        task_idx, seq, query_idx, article = item
+        if article is None:
+            released = dedup_order.finish_task(task_idx, seq)
+        else:
+            released = dedup_order.add(task_idx, seq, (query_idx, article))
+        for query_idx, article in released:
+            dedup_article(query_idx, article, emit)
+
+    def dedup_article(query_idx, article, emit):
+        #handle empty cases
+        if (article.title == "") | (article.title == " ") | (article.title == None):
+            im.incr("articles.empty_title")
+        elif dedup_index.contains(article):
+            im.incr("articles.duplicate")
+        elif near_duplicate_index is not None and len(near_duplicate_index.filter_articles([article])) == 0:
+            pass
+        else:
+            im.incr("articles.accepted")
+            dedup_index.add(article)
+            if run_topic_check:
+                article.topic_check = None
+                article.topic_check_query = queries_topic_checks[query_idx]
+            else:
+                article.topic_check = "N/A"
+                article.topic_check_query = "N/A"
+            article.relevant_pred = "TBD"
+            emit(article)
+
+    def topic_check(article, emit):
+        prefilter_response = topic_prefilter.check(article.topic_check_query, article.abstract) if topic_prefilter is not None else None
+        if prefilter_response is not None:
+            article.topic_check = prefilter_response
+        else:
+            #review the content with ChatGPT - workers share the reviewer's rate limits, retries and cache
+            llm_topic_mention_prompt = LLM_TOPIC_MENTION_PROMPT_TEMPLATE.format(topic=article.topic_check_query, abstract=article.abstract)
+            article.topic_check = llm_agent.review(llm_topic_mention_prompt)
+        emit(article)
+
+    relevance_buffer = []
+
+    def score_relevance_buffer(emit):
+        #all buffered articles are encoded and scored in one batch
+        rm.predict_relevance(relevance_buffer, relevance_model_filepath, relevance_model_encoder_filepath, batch_size=relevance_batch_size, embedding_store=embedding_store,
+                             fields=relevance_fields, threshold=relevance_threshold, max_abstract_chars=relevance_max_abstract_chars)
+        for article in relevance_buffer:
+            emit(article)
+        relevance_buffer.clear()
+
+    def relevance(article, emit):
+        relevance_buffer.append(article)
+        if len(relevance_buffer) >= relevance_batch_size:
+            score_relevance_buffer(emit)
+
+    def sink(article, emit):
+        sheet_store.append_articles([article])
+        if len(sheet_store.pending_rows) >= sink_flush_size:
+            sheet_store.flush()
+
+    stages = [
+        #one thread per (query, source) task - the consolidator's per-source semaphores and rate limiters bound the API load
+        Stage("search", search, workers=max(1, len(search_tasks)), queue_size=queue_size),
+        Stage("normalize", normalize, workers=normalize_workers, queue_size=queue_size),
+        #single worker so dedup decisions are made against a consistent index
+        Stage("dedup", dedup, workers=1, queue_size=queue_size)
+    ]
+    if run_topic_check:
+        stages.append(Stage("topic_check", topic_check, workers=llm_max_workers, queue_size=queue_size))
+    else:
+        print("Topic check query not run")
+    if run_relevance_model:
+        print("Relevance model running")
+        stages.append(Stage("relevance", relevance, workers=1, queue_size=queue_size, finish=lambda emit: score_relevance_buffer(emit) if relevance_buffer else None))
+    else:
+        print("Relevance model not run")
+    stages.append(Stage("sink", sink, workers=1, queue_size=queue_size, finish=lambda emit: sheet_store.flush()))
+
+    try:
+        Pipeline(stages).run(enumerate(search_tasks))
+    except Exception:
+        #keep the articles that made it through every stage before the failure
+        if sheet_store.pending_rows:
+            sheet_store.flush()
+        raise
+    finally:
+        #hits since the last put still need their access times written for LRU eviction
+        if llm_cache is not None:
+            llm_cache.flush()
+
+    #only advance the watermarks once the articles are safely in the sheet
+    if watermark_store is not None:
+        watermark_store.save()
+
+    #one structured report per run in place of per-article logging
+    report_sections = {"search_date": search_date, "duration_s": round(time.perf_counter() - run_start, 3)}
+    if topic_prefilter is not None:
+        #"llm" is the number of articles the cascade could not decide
+        report_sections["topic_prefilter"] = topic_prefilter.stats()
+    if llm_cache is not None:
+        report_sections["llm_cache"] = llm_cache.stats()
+    if embedding_store is not None:
+        report_sections["embedding_store"] = embedding_store.stats()
+    if profile_path is not None:
+        print(im.write_profile(profile_path))
+        report_sections["profile_path"] = profile_path
+    run_report = im.run_report(**report_sections)
+    print(json.dumps(run_report))
+    if emf_namespace:
+        print(json.dumps(im.emf_record(run_report, emf_namespace)))
+    return run_report
@@ -1,72 +1,152 @@
+import os
+import random
+import time
 import requests
 import xml.etree.ElementTree as ET
+from article import Article
+import instrumentation as im
 
 class PubMedSearch:
-    def __init__(self, query, max_results=10, min_date='2020/01/01'):
+    def __init__(self, query, max_results=10, min_date='2020/01/01', fetch_chunk_size=200, session=None, rate_limiter=None, max_date=None, date_type=None, max_retries=5, search_page_size=10000):
         self.query = query
         self.max_results = max_results
         self.min_date = min_date
-        self.base_url = 'https://eutils.ncbi.nlm.nih.gov/entrez/eutils/'
+        #esearch only applies a date range when both mindate and maxdate are set, e.g. date_type='edat' for date added to PubMed
+        self.max_date = max_date
+        self.date_type = date_type
+        #number of IDs sent per efetch request - NCBI recommends up to ~200 per GET
+        self.fetch_chunk_size = fetch_chunk_size
+        #IDs requested per esearch page - esearch returns at most 10000 per request
+        self.search_page_size = search_page_size
+        #pooled session so esearch and all efetch requests reuse the same connection
+        self.session = session if session is not None else requests.Session()
+        #optional shared limiter (see rate_limiter.RateLimiter) called before every request
+        self.rate_limiter = rate_limiter
+        self.max_retries = max_retries
+        #overridable e.g. to point at a local fake server (see benchmarks/fake_services.py)
+        self.base_url = os.getenv('PUBMED_BASE_URL', 'https://eutils.ncbi.nlm.nih.gov/entrez/eutils/')
         self.search_url = self.base_url + 'esearch.fcgi'
         self.fetch_url = self.base_url + 'efetch.fcgi'
+        #total matches reported by esearch, set once the search has run - more than the IDs returned when max_results cut the search short
+        self.total_count = None
+        self.n_ids = 0
+
+    @property
+    def truncated(self):
+        return self.total_count is not None and self.total_count > self.n_ids
 
     def search(self):
         params = {
             'db': 'pubmed',
             'term': self.query,
             'retmode': 'xml',
-            'retmax': self.max_results,
             'sort': 'pubdate',
             'mindate': self.min_date
         }
+        if self.max_date is not None:
+            params['maxdate'] = self.max_date
+        if self.date_type is not None:
+            params['datetype'] = self.date_type
 
-        # Make a request to the PubMed API to retrieve the list of article IDs
-        response = requests.get(self.search_url, params=params)
+        # Make requests to the PubMed API to retrieve the list of article IDs, paging with retstart until max_results or Count is reached
+        id_list = []
+        while len(id_list) < self.max_results:
+            params['retstart'] = len(id_list)
+            params['retmax'] = min(self.search_page_size, self.max_results - len(id_list))
+            response = self.get_with_retry(self.search_url, params, "pubmed.esearch")
 
-        # Parse the XML response using ElementTree
-        root = ET.fromstring(response.content)
-        id_list = [id_elem.text for id_elem in root.findall('.//Id')]
+            # Parse the XML response using ElementTree
+            root = ET.fromstring(response.content)
+            count_elem = root.find('./Count')
+            self.total_count = int(count_elem.text) if count_elem is not None else None
+            page_ids = [id_elem.text for id_elem in root.findall('./IdList/Id')]
+            id_list.extend(page_ids)
+            if len(page_ids) < params['retmax'] or self.total_count is None or len(id_list) >= self.total_count:
+                break
+        self.n_ids = len(id_list)
 
-        # Make a request to the PubMed API to retrieve the abstract for each article
+        # Retrieve the abstracts in chunks of comma-separated IDs rather than one request per article
         articles = []
-        for article_id in id_list:
-            fetch_params = {
-                'db': 'pubmed',
-                'id': article_id,
-                'retmode': 'xml',
-                'rettype': 'abstract', 
-                'pubdate': 'Y'
-            }
-            fetch_response = requests.get(self.fetch_url, params=fetch_params)
+        for chunk_start in range(0, len(id_list), self.fetch_chunk_size):
+            chunk_ids = id_list[chunk_start:chunk_start + self.fetch_chunk_size]
+            articles.extend(self.fetch(chunk_ids))
 
-            # Parse the XML response using ElementTree
-            fetch_root = ET.fromstring(fetch_response.content)
-            article_elem = fetch_root.find('.//PubmedArticle')
-            title_elem = article_elem.find('.//ArticleTitle')
-            title = title_elem.text if title_elem is not None else ''
-            abstract_elem = article_elem.find('.//AbstractText')
-            abstract = abstract_elem.text if abstract_elem is not None else ''
-
-            pubdate_elem = article_elem.find('.//PubDate') 
-            pubdate = ''
+        return articles
+
+    def wait_for_rate_limit(self):
+        if self.rate_limiter is not None:
+            self.rate_limiter.wait()
+
+    def get_with_retry(self, url, params, timer_name):
+        for attempt in range(self.max_retries + 1):
+            self.wait_for_rate_limit()
+            with im.timer(timer_name):
+                response = self.session.get(url, params=params)
+            #only rate limit (429) and server errors are worth retrying - E-utilities answers them with a JSON or HTML body, not XML
+            if response.status_code != 429 and response.status_code < 500:
+                break
+            if attempt == self.max_retries:
+                break
+            backoff = min(64, 2 ** attempt) + random.uniform(0, 1)
+            im.incr("pubmed.retries")
+            print(f"PubMed request failed ({response.status_code}), retrying in {backoff:.1f}s")
+            time.sleep(backoff)
+        response.raise_for_status()
+        return response
+
+    def fetch(self, id_list):
+        fetch_params = {
+            'db': 'pubmed',
+            'id': ','.join(id_list),
+            'retmode': 'xml',
+            'rettype': 'abstract',
+            'pubdate': 'Y'
+        }
+        fetch_response = self.get_with_retry(self.fetch_url, fetch_params, "pubmed.efetch")
+
+        # Parse the XML response using ElementTree
+        fetch_root = ET.fromstring(fetch_response.content)
+        articles_by_id = {}
+        for article_elem in fetch_root.findall('.//PubmedArticle'):
+            article_id, article = self.parse_article(article_elem)
+            articles_by_id[article_id] = article
+
+        # Keep the esearch (pubdate) order as efetch does not guarantee it
+        return [articles_by_id[article_id] for article_id in id_list if article_id in articles_by_id]
+
+    def parse_article(self, article_elem):
+        title_elem = article_elem.find('.//ArticleTitle')
+        title = title_elem.text if title_elem is not None else ''
+        abstract_elem = article_elem.find('.//AbstractText')
+        abstract = abstract_elem.text if abstract_elem is not None else ''
+
+        pubdate_elem = article_elem.find('.//PubDate')
+        year = month = day = ''
+        if pubdate_elem is not None:
             year_elem = pubdate_elem.find('.//Year')
             year = year_elem.text if year_elem is not None else ''
-            month_elem = pubdate_elem.find('.//Month') 
+            month_elem = pubdate_elem.find('.//Month')
             month = month_elem.text if month_elem is not None else ''
             day_elem = pubdate_elem.find('.//Day')
             day = day_elem.text if day_elem is not None else ''
-            pubdate = f'{year}-{month}-{day}'
+        pubdate = f'{year}-{month}-{day}'
 
-            url_elem = article_elem.find('.//ArticleId[@IdType="pubmed"]')
-            url = f'https://pubmed.ncbi.nlm.nih.gov/{url_elem.text}' if url_elem is not None else ''
+        #PMID is taken from MedlineCitation as ArticleId elements also appear for each reference
+        pmid_elem = article_elem.find('./MedlineCitation/PMID')
+        if pmid_elem is None:
+            pmid_elem = article_elem.find('.//ArticleId[@IdType="pubmed"]')
+        article_id = pmid_elem.text if pmid_elem is not None else ''
+        url = f'https://pubmed.ncbi.nlm.nih.gov/{article_id}' if article_id else ''
+        doi_elem = article_elem.find('./PubmedData/ArticleIdList/ArticleId[@IdType="doi"]')
+        doi = doi_elem.text if doi_elem is not None else ''
 
-            article = {
-                'title': title,
-                'abstract': abstract,
-                'pubdate': pubdate, 
-                'link': url
-            }
-            
-            articles.append(article)
+        article = Article(
+            title=title,
+            abstract=abstract,
+            published=pubdate,
+            link=url,
+            source='PubMed',
+            doi=doi
+        )
 
-        return articles
+        return article_id, article
@@ -0,0 +1,40 @@
+import threading
+import time
+
+class RateLimiter:
+    #thread-safe limiter that spaces out request start times to at most requests_per_second
+    def __init__(self, requests_per_second):
+        self.min_interval = 1.0 / requests_per_second
+        self.lock = threading.Lock()
+        self.next_request_time = 0.0
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            wait_time = self.next_request_time - now
+            self.next_request_time = max(now, self.next_request_time) + self.min_interval
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+class TokenBucket:
+    #thread-safe token bucket refilled continuously at capacity_per_minute, used for requests/min and tokens/min quotas
+    def __init__(self, capacity_per_minute):
+        self.capacity = capacity_per_minute
+        self.tokens = capacity_per_minute
+        self.refill_rate = capacity_per_minute / 60.0
+        self.lock = threading.Lock()
+        self.last_refill_time = time.monotonic()
+
+    def acquire(self, amount=1):
+        #requests larger than the bucket could never be served, so cap them at its capacity
+        amount = min(amount, self.capacity)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last_refill_time) * self.refill_rate)
+                self.last_refill_time = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait_time = (amount - self.tokens) / self.refill_rate
+            time.sleep(wait_time)
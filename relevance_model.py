@@ -0,0 +1,144 @@
+import json
+import os
+import pickle
+import numpy as np
+from embedding_store import EmbeddingStore
+import instrumentation as im
+from utils import parse_relevance_preds, parse_relevance_probs
+
+#heavy dependencies (sentence_transformers -> torch / transformers, onnxruntime) are imported on first use
+#so a run with run_relevance_model off never pays for them on a cold start
+ONNX_MODEL_FILENAME = 'model.onnx'
+ONNX_TOKENIZER_FILENAME = 'tokenizer.json'
+
+#written by train_relevance.py next to each model.pkl
+RELEVANCE_METADATA_FILENAME = 'metadata.json'
+
+#article fields that can be embedded as relevance model features
+RELEVANCE_FIELDS = ('title', 'abstract', 'query')
+
+#models are cached at module scope so they are loaded once per process and reused across warm lambda invocations
+_relevance_models = {}
+_encoders = {}
+_embedding_stores = {}
+
+def get_relevance_model(relevance_model_filepath):
+    if relevance_model_filepath not in _relevance_models:
+        with im.timer("relevance.model_load"), open(relevance_model_filepath, 'rb') as f:
+            _relevance_models[relevance_model_filepath] = pickle.load(f)
+    return _relevance_models[relevance_model_filepath]
+
+def get_relevance_metadata(relevance_model_filepath):
+    #fields, threshold and encoder a train_relevance.py artifact was trained with - empty for a bare pickled model
+    metadata_filepath = os.path.join(os.path.dirname(relevance_model_filepath), RELEVANCE_METADATA_FILENAME)
+    if not os.path.exists(metadata_filepath):
+        return {}
+    with open(metadata_filepath) as f:
+        return json.load(f)
+
+def get_encoder(relevance_model_encoder_filepath):
+    #a directory written by build_models.py --onnx is served with onnxruntime, anything else with SentenceTransformer
+    if relevance_model_encoder_filepath not in _encoders:
+        with im.timer("relevance.encoder_load"):
+            if os.path.exists(os.path.join(relevance_model_encoder_filepath, ONNX_MODEL_FILENAME)):
+                _encoders[relevance_model_encoder_filepath] = OnnxEncoder(relevance_model_encoder_filepath)
+            else:
+                from sentence_transformers import SentenceTransformer
+                _encoders[relevance_model_encoder_filepath] = SentenceTransformer(relevance_model_encoder_filepath)
+    return _encoders[relevance_model_encoder_filepath]
+
+def get_embedding_store(embedding_store_dirpath, encoder_id):
+    #keyed on the encoder too - each encoder version has its own rows in the store
+    if (embedding_store_dirpath, encoder_id) not in _embedding_stores:
+        _embedding_stores[(embedding_store_dirpath, encoder_id)] = EmbeddingStore(embedding_store_dirpath, encoder_id)
+    return _embedding_stores[(embedding_store_dirpath, encoder_id)]
+
+class OnnxEncoder:
+    #lightweight MiniLM inference without torch - mean pooled, L2 normalised embeddings matching all-MiniLM-L6-v2
+    def __init__(self, encoder_dirpath, max_seq_length=256):
+        import onnxruntime
+        from tokenizers import Tokenizer
+        self.session = onnxruntime.InferenceSession(os.path.join(encoder_dirpath, ONNX_MODEL_FILENAME), providers=['CPUExecutionProvider'])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+        self.tokenizer = Tokenizer.from_file(os.path.join(encoder_dirpath, ONNX_TOKENIZER_FILENAME))
+        self.tokenizer.enable_truncation(max_length=max_seq_length)
+        self.tokenizer.enable_padding()
+
+    def encode(self, sentences, batch_size=32):
+        single_sentence = isinstance(sentences, str)
+        if single_sentence:
+            sentences = [sentences]
+
+        embeddings = []
+        for batch_start in range(0, len(sentences), batch_size):
+            encodings = self.tokenizer.encode_batch(sentences[batch_start:batch_start + batch_size])
+            input_ids = np.array([encoding.ids for encoding in encodings], dtype=np.int64)
+            attention_mask = np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+            model_inputs = {'input_ids': input_ids, 'attention_mask': attention_mask, 'token_type_ids': np.zeros_like(input_ids)}
+            token_embeddings = self.session.run(None, {name: value for name, value in model_inputs.items() if name in self.input_names})[0]
+
+            mask = attention_mask[:, :, None].astype(np.float32)
+            sentence_embeddings = (token_embeddings * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+            embeddings.append(sentence_embeddings / np.maximum(np.linalg.norm(sentence_embeddings, axis=1, keepdims=True), 1e-12))
+
+        embeddings = np.concatenate(embeddings).astype(np.float32) if embeddings else np.zeros((0, 0), dtype=np.float32)
+        return embeddings[0] if single_sentence else embeddings
+
+def truncate_text(text, max_chars):
+    #cut at the last word boundary before max_chars - the encoder only sees its first max_seq_length tokens anyway
+    text = str(text or '')
+    if max_chars is None or len(text) <= max_chars:
+        return text
+    return text[:max_chars].rsplit(' ', 1)[0]
+
+def make_relevance_features(articles, encoder, fields=('title',), max_abstract_chars=1000, batch_size=32, embedding_store=None):
+    #(n_articles, n_fields * dim) matrix - one embedding per field concatenated in fields order
+    #every field's text goes through a single batched encoder pass, and repeated texts (e.g. the query) are encoded once
+    field_texts = []
+    for field in fields:
+        if field not in RELEVANCE_FIELDS:
+            raise ValueError(f"Unknown relevance field: {field}")
+        if field == 'abstract':
+            field_texts.append([truncate_text(article.abstract, max_abstract_chars) for article in articles])
+        else:
+            field_texts.append([str(getattr(article, field) or '') for article in articles])
+
+    unique_texts = list(dict.fromkeys(text for texts in field_texts for text in texts))
+    #with an embedding store, texts already encoded by training or an earlier run are read back instead
+    if embedding_store is not None:
+        unique_vectors = embedding_store.encode(unique_texts, encoder, batch_size=batch_size)
+    else:
+        unique_vectors = np.asarray(encoder.encode(unique_texts, batch_size=batch_size), dtype=np.float32)
+    text_rows = {text: row for row, text in enumerate(unique_texts)}
+
+    return np.concatenate([unique_vectors[[text_rows[text] for text in texts]] for texts in field_texts], axis=1)
+
+def predict_relevance(articles, relevance_model_filepath, relevance_model_encoder_filepath="sentence-transformers/all-MiniLM-L6-v2", batch_size=32, embedding_store=None,
+                      fields=('title',), threshold=None, max_abstract_chars=1000):
+    #fields must match the features the model was trained on e.g. ('title',) for the v1 model or ('title', 'abstract', 'query')
+    #with a threshold the model's predict_proba is used and the probability kept on article.relevant_prob, otherwise its hard predict
+    if len(articles) == 0:
+        return articles
+
+    relevance_model = get_relevance_model(relevance_model_filepath)
+    encoder = get_encoder(relevance_model_encoder_filepath)
+
+    with im.timer("relevance.encode"):
+        features = make_relevance_features(articles, encoder, fields=fields, max_abstract_chars=max_abstract_chars, batch_size=batch_size, embedding_store=embedding_store)
+
+    #generate predictions in a single call and convert into format
+    with im.timer("relevance.predict"):
+        if threshold is not None:
+            relevance_probs = relevance_model.predict_proba(features)[:, 1]
+            relevance_preds = parse_relevance_probs(relevance_probs, threshold)
+            for article, relevance_prob in zip(articles, relevance_probs):
+                article.relevant_prob = round(float(relevance_prob), 4)
+        else:
+            relevance_preds = parse_relevance_preds(relevance_model.predict(features))
+    im.incr("relevance.articles_scored", len(articles))
+
+    #fill in records
+    for article, relevance_pred in zip(articles, relevance_preds):
+        article.relevant_pred = relevance_pred
+
+    return articles
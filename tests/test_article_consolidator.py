@@ -0,0 +1,94 @@
+from datetime import datetime
+import pytest
+import article_consolidator as ac
+from article import Article
+from watermark_store import WatermarkStore
+
+class FakePubMedSearch:
+    #stands in for pubmed_search.PubMedSearch - total_count matches, of which at most max_results are returned
+    total_count = 0
+    instances = []
+
+    def __init__(self, query, max_results=10, min_date=None, **kwargs):
+        self.max_results = max_results
+        self.min_date = min_date
+        FakePubMedSearch.instances.append(self)
+
+    @property
+    def truncated(self):
+        return self.total_count > self.max_results
+
+    def search(self):
+        return [Article(title=f'Paper {idx}') for idx in range(min(self.total_count, self.max_results))]
+
+class FakeArxivSearch:
+    #newest first, one hour apart, stopping at updated_after like ArxivSearch.iter_search
+    total_results = 0
+
+    def __init__(self, query, max_results, updated_after=None, **kwargs):
+        self.max_results = max_results
+        self.updated_after = updated_after
+        self.truncated = False
+
+    def iter_search(self):
+        for idx in range(self.total_results):
+            if idx >= self.max_results:
+                self.truncated = True
+                return
+            updated = f'2023-12-01T{23 - idx:02d}:00:00Z'
+            if self.updated_after is not None and updated <= self.updated_after:
+                return
+            yield Article(title=f'Preprint {idx}', updated=updated)
+
+@pytest.fixture
+def fake_searches(monkeypatch):
+    FakePubMedSearch.instances = []
+    monkeypatch.setattr(ac.pb, 'PubMedSearch', FakePubMedSearch)
+    monkeypatch.setattr(ac.ar, 'ArxivSearch', FakeArxivSearch)
+
+def run_source(watermark_store, source, max_results=10, incremental_max_results=50):
+    consolidator = ac.ArticleConsolidator('llm', max_results, min_date='2020/01/01', search_sources=[source], watermark_store=watermark_store, incremental_max_results=incremental_max_results)
+    articles = list(consolidator.iter_source(source))
+    watermark_store.save()
+    return articles
+
+def test_first_run_sets_pubmed_watermark(fake_searches, monkeypatch, tmp_path):
+    watermark_store = WatermarkStore(str(tmp_path / 'watermarks.json'))
+    monkeypatch.setattr(FakePubMedSearch, 'total_count', 100)
+    assert len(run_source(watermark_store, 'pubmed')) == 10
+    #older history past the cap is left to backfill.py
+    assert watermark_store.get('llm', 'pubmed') == datetime.now().strftime('%Y/%m/%d')
+
+def test_incremental_pubmed_uses_higher_cap(fake_searches, monkeypatch, tmp_path):
+    watermark_store = WatermarkStore(str(tmp_path / 'watermarks.json'))
+    watermark_store.update('llm', 'pubmed', '2023/11/01')
+    watermark_store.save()
+    monkeypatch.setattr(FakePubMedSearch, 'total_count', 30)
+    assert len(run_source(watermark_store, 'pubmed')) == 30
+    assert FakePubMedSearch.instances[-1].min_date == '2023/11/01'
+    assert watermark_store.get('llm', 'pubmed') == datetime.now().strftime('%Y/%m/%d')
+
+def test_truncated_pubmed_search_keeps_watermark(fake_searches, monkeypatch, tmp_path):
+    watermark_store = WatermarkStore(str(tmp_path / 'watermarks.json'))
+    watermark_store.update('llm', 'pubmed', '2023/11/01')
+    watermark_store.save()
+    monkeypatch.setattr(FakePubMedSearch, 'total_count', 80)
+    assert len(run_source(watermark_store, 'pubmed')) == 50
+    assert watermark_store.get('llm', 'pubmed') == '2023/11/01'
+
+def test_incremental_arxiv_advances_to_newest_update(fake_searches, monkeypatch, tmp_path):
+    watermark_store = WatermarkStore(str(tmp_path / 'watermarks.json'))
+    watermark_store.update('llm', 'arxiv', '2023-12-01T15:00:00Z')
+    watermark_store.save()
+    monkeypatch.setattr(FakeArxivSearch, 'total_results', 20)
+    #only the 8 preprints updated after 15:00 are returned, even though max_results is 5
+    assert len(run_source(watermark_store, 'arxiv', max_results=5)) == 8
+    assert watermark_store.get('llm', 'arxiv') == '2023-12-01T23:00:00Z'
+
+def test_truncated_arxiv_search_keeps_watermark(fake_searches, monkeypatch, tmp_path):
+    watermark_store = WatermarkStore(str(tmp_path / 'watermarks.json'))
+    watermark_store.update('llm', 'arxiv', '2023-12-01T00:00:00Z')
+    watermark_store.save()
+    monkeypatch.setattr(FakeArxivSearch, 'total_results', 20)
+    assert len(run_source(watermark_store, 'arxiv', incremental_max_results=10)) == 10
+    assert watermark_store.get('llm', 'arxiv') == '2023-12-01T00:00:00Z'
@@ -0,0 +1,151 @@
+#ArxivSearch against a recorded Atom feed served from a local HTTP server
+import http.server
+import os
+import threading
+import urllib.error
+import urllib.parse
+import xml.etree.ElementTree as ET
+import pytest
+import arxiv_search
+from arxiv_search import ATOM_NAMESPACE, OPENSEARCH_NAMESPACE, ArxivSearch
+
+FIXTURES_DIRPATH = os.path.join(os.path.dirname(__file__), 'fixtures')
+#the recorded feed, newest update first as requested by sortBy=lastUpdatedDate
+ARXIV_IDS = ['2312.04001v2', '2312.03002v1', '2311.09003v3', '2311.05004v1', '2310.01005v2']
+
+class RecordedArxivHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        params = {key: values[0] for key, values in urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query).items()}
+        self.server.requests.append(params)
+
+        if self.server.error_statuses:
+            self.send_payload(self.server.error_statuses.pop(0), 'text/plain', b'Service Unavailable')
+            return
+        #the recorded entries, paged by start / max_results - totalResults stays the total unless overridden
+        with open(os.path.join(FIXTURES_DIRPATH, 'arxiv_query.xml'), 'rb') as f:
+            root = ET.fromstring(f.read())
+        start, max_results = int(params['start']), int(params['max_results'])
+        for idx, entry_elem in enumerate(root.findall(f'{ATOM_NAMESPACE}entry')):
+            if not start <= idx < start + max_results:
+                root.remove(entry_elem)
+        if self.server.total_results is not None:
+            root.find(f'{OPENSEARCH_NAMESPACE}totalResults').text = str(self.server.total_results)
+        self.send_payload(200, 'application/atom+xml', ET.tostring(root))
+
+    def send_payload(self, status, content_type, payload):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+class NoWaitLimiter:
+    calls = 0
+    def wait(self):
+        self.calls += 1
+
+@pytest.fixture
+def arxiv_server(monkeypatch):
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), RecordedArxivHandler)
+    server.requests = []
+    #statuses returned, in order, before the fixture is served
+    server.error_statuses = []
+    server.total_results = None
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv('ARXIV_BASE_URL', f'http://127.0.0.1:{server.server_address[1]}/api/query?')
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(arxiv_search.time, 'sleep', sleeps.append)
+    return sleeps
+
+def make_search(**kwargs):
+    return ArxivSearch('large language model', rate_limiter=NoWaitLimiter(), **kwargs)
+
+def request_pages(arxiv_server):
+    return [(int(params['start']), int(params['max_results'])) for params in arxiv_server.requests]
+
+def test_search_output_shape(arxiv_server):
+    articles = make_search(max_results=10).search()
+    assert [article.link.rsplit('/', 1)[-1] for article in articles] == ARXIV_IDS
+    article = articles[0]
+    assert article.title == 'Large Language Models for Menopause Symptom Triage'
+    assert article.abstract.split() == 'We evaluate large language models on triaging hot flushes and sleep disturbance reported in patient messages.'.split()
+    assert (article.published, article.updated) == ('2023-12-06T09:12:45Z', '2023-12-07T18:21:04Z')
+    assert article.source == 'Arxiv'
+    assert article.doi == '10.1000/triage.2023.1'
+    #entries without an arxiv:doi come back with an empty string
+    assert articles[1].doi == ''
+
+def test_search_params(arxiv_server):
+    make_search(max_results=10, submitted_date_range=('20231101', '20231130')).search()
+    params = arxiv_server.requests[0]
+    assert params['search_query'] == 'all:large language model AND submittedDate:[202311010000 TO 202311302359]'
+    assert (params['sortBy'], params['sortOrder']) == ('lastUpdatedDate', 'descending')
+
+def test_search_pages_until_total_results(arxiv_server):
+    arxiv_search = make_search(max_results=100, page_size=2)
+    assert [article.link.rsplit('/', 1)[-1] for article in arxiv_search.search()] == ARXIV_IDS
+    assert request_pages(arxiv_server) == [(0, 2), (2, 2), (4, 2)]
+    assert arxiv_search.total_results == 5
+    assert not arxiv_search.truncated
+
+def test_search_stops_at_total_results_after_full_page(arxiv_server):
+    #the last page is full, so only totalResults shows there is nothing left to request
+    assert len(make_search(max_results=100, page_size=5).search()) == 5
+    assert request_pages(arxiv_server) == [(0, 5)]
+
+def test_search_stops_on_short_page(arxiv_server):
+    #arXiv can report more results than it returns - a short page ends the search
+    arxiv_server.total_results = 50
+    arxiv_search = make_search(max_results=100, page_size=2)
+    assert len(arxiv_search.search()) == 5
+    assert request_pages(arxiv_server) == [(0, 2), (2, 2), (4, 2)]
+    assert not arxiv_search.truncated
+
+def test_search_truncated_by_max_results(arxiv_server):
+    arxiv_search = make_search(max_results=3, page_size=2)
+    assert len(arxiv_search.search()) == 3
+    #the last page only asks for the results still needed
+    assert request_pages(arxiv_server) == [(0, 2), (2, 1)]
+    assert arxiv_search.truncated
+
+def test_search_stops_at_updated_after(arxiv_server):
+    arxiv_search = make_search(max_results=100, page_size=2, updated_after='2023-12-01T08:30:00Z')
+    assert [article.link.rsplit('/', 1)[-1] for article in arxiv_search.search()] == ARXIV_IDS[:2]
+    #the first entry not updated after the watermark ends paging - the rest of its page is not read
+    assert request_pages(arxiv_server) == [(0, 2), (2, 2)]
+    assert not arxiv_search.truncated
+
+def test_rate_limiter_called_per_request(arxiv_server):
+    arxiv_search = make_search(max_results=100, page_size=2)
+    arxiv_search.search()
+    assert arxiv_search.rate_limiter.calls == len(arxiv_server.requests) == 3
+
+def test_search_retries_rate_limit_and_server_errors(arxiv_server, sleeps):
+    arxiv_server.error_statuses = [503, 429, 500]
+    assert len(make_search(max_results=10).search()) == 5
+    assert len(arxiv_server.requests) == 4
+    #exponential backoff with up to a second of jitter
+    assert [int(sleep) for sleep in sleeps] == [1, 2, 4]
+
+def test_search_does_not_retry_client_errors(arxiv_server, sleeps):
+    arxiv_server.error_statuses = [400]
+    with pytest.raises(urllib.error.HTTPError):
+        make_search(max_results=10).search()
+    assert len(arxiv_server.requests) == 1
+    assert sleeps == []
+
+def test_search_gives_up_after_max_retries(arxiv_server, sleeps):
+    arxiv_server.error_statuses = [503] * 10
+    with pytest.raises(urllib.error.HTTPError):
+        make_search(max_results=10, max_retries=2).search()
+    assert len(arxiv_server.requests) == 3
+    assert len(sleeps) == 2
@@ -0,0 +1,53 @@
+from datetime import datetime
+import pytest
+import article_consolidator as ac
+import backfill
+from article import Article
+
+class DailyPubMedSearch:
+    #stands in for pubmed_search.PubMedSearch with results_per_day matches on every day of the window
+    results_per_day = 4
+    windows = []
+
+    def __init__(self, query, max_results=10, min_date=None, max_date=None, **kwargs):
+        self.max_results = max_results
+        self.window = (min_date, max_date)
+        n_days = (datetime.strptime(max_date, '%Y/%m/%d') - datetime.strptime(min_date, '%Y/%m/%d')).days + 1
+        self.total_count = n_days * self.results_per_day
+        DailyPubMedSearch.windows.append(self.window)
+
+    @property
+    def truncated(self):
+        return self.total_count > self.max_results
+
+    def search(self):
+        return [Article(title=f'{self.window[0]} paper {idx}') for idx in range(min(self.total_count, self.max_results))]
+
+@pytest.fixture
+def daily_search(monkeypatch):
+    DailyPubMedSearch.windows = []
+    monkeypatch.setattr(ac.pb, 'PubMedSearch', DailyPubMedSearch)
+
+def test_make_date_windows():
+    assert backfill.make_date_windows('2023/01/01', '2023/01/25', 10) == [('2023/01/01', '2023/01/10'), ('2023/01/11', '2023/01/20'), ('2023/01/21', '2023/01/25')]
+
+def test_window_within_max_results_searched_once(daily_search):
+    articles = backfill.search_window('llm', 'pubmed', ('2023/01/01', '2023/01/02'), 10, 'search_date')
+    assert len(articles) == 8
+    assert DailyPubMedSearch.windows == [('2023/01/01', '2023/01/02')]
+
+def test_truncated_window_is_split(daily_search):
+    #10 days x 4 results per day against a cap of 10 - split until each window has at most 2 days
+    articles = backfill.search_window('llm', 'pubmed', ('2023/01/01', '2023/01/10'), 10, 'search_date')
+    assert len(articles) == 40
+    assert DailyPubMedSearch.windows == [
+        ('2023/01/01', '2023/01/10'),
+        ('2023/01/01', '2023/01/05'), ('2023/01/01', '2023/01/03'), ('2023/01/01', '2023/01/02'), ('2023/01/03', '2023/01/03'), ('2023/01/04', '2023/01/05'),
+        ('2023/01/06', '2023/01/10'), ('2023/01/06', '2023/01/08'), ('2023/01/06', '2023/01/07'), ('2023/01/08', '2023/01/08'), ('2023/01/09', '2023/01/10'),
+    ]
+
+def test_truncated_single_day_fails(daily_search, monkeypatch):
+    #left unwritten by run_backfill so the next run retries it
+    monkeypatch.setattr(DailyPubMedSearch, 'results_per_day', 20)
+    with pytest.raises(RuntimeError, match='higher --max-results'):
+        backfill.search_window('llm', 'pubmed', ('2023/01/01', '2023/01/04'), 10, 'search_date')
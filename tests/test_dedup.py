@@ -0,0 +1,107 @@
+import numpy as np
+import pytest
+from article import Article
+from dedup import DedupIndex, EmbeddingLSHIndex, MinHashLSHIndex, article_keys, make_near_duplicate_index, near_duplicate_text
+from embedding_store import EmbeddingStore
+
+class BagOfWordsEncoder:
+    #deterministic stand-in for the SentenceTransformer - titles sharing most words get a high cosine similarity
+    def __init__(self, dim=64):
+        self.dim = dim
+        self.n_encoded = 0
+
+    def encode(self, sentences, batch_size=32):
+        self.n_encoded += len(sentences)
+        vectors = np.zeros((len(sentences), self.dim), dtype=np.float32)
+        for row, sentence in enumerate(sentences):
+            for word in near_duplicate_text(sentence).split():
+                vectors[row, sum(word.encode('utf-8')) % self.dim] += 1
+        return vectors
+
+def test_article_keys():
+    assert article_keys('A Title') == article_keys('  a   TITLE ')
+    assert len(article_keys('Title', 'https://pubmed.ncbi.nlm.nih.gov/38012345', '10.1000/XYZ')) == 3
+    assert article_keys('', doi='10.1000/XYZ') == article_keys('', doi=' 10.1000/xyz ')
+    #arXiv versions share a key
+    assert article_keys('', 'http://arxiv.org/abs/2311.01234v2') == article_keys('', 'http://arxiv.org/abs/2311.01234v1')
+    assert article_keys('', 'http://arxiv.org/abs/2311.01234v1') == article_keys('', 'http://arxiv.org/abs/2311.01234')
+    assert article_keys('', 'https://example.com/paper') == []
+
+def test_dedup_index_matches_any_key():
+    dedup_index = DedupIndex.from_sheet_values(
+        ['Title', 'Evaluating Large Language Models', 'Another paper'],
+        ['Link', 'https://pubmed.ncbi.nlm.nih.gov/111', 'http://arxiv.org/abs/2311.01234v1']
+    )
+    assert dedup_index.contains(Article(title='evaluating large  language models'))
+    assert dedup_index.contains(Article(title='Renamed in print', link='https://pubmed.ncbi.nlm.nih.gov/111'))
+    assert dedup_index.contains(Article(title='Renamed preprint', link='http://arxiv.org/abs/2311.01234v3'))
+    assert not dedup_index.contains(Article(title='A new paper', link='https://pubmed.ncbi.nlm.nih.gov/222'))
+
+def test_dedup_index_add():
+    dedup_index = DedupIndex.from_sheet_values([])
+    article = Article(title='New paper', link='https://pubmed.ncbi.nlm.nih.gov/333', doi='10.1000/abc')
+    assert not dedup_index.contains(article)
+    dedup_index.add(article)
+    assert dedup_index.contains(Article(doi='10.1000/ABC'))
+    assert len(dedup_index) == 3
+
+def test_dedup_index_links_shorter_than_titles():
+    #the link column can be shorter than the title column when trailing cells are empty
+    dedup_index = DedupIndex.from_sheet_values(['Title', 'Paper one', 'Paper two'], ['Link'])
+    assert dedup_index.contains(Article(title='Paper two'))
+
+def test_minhash_finds_punctuation_variants():
+    minhash_index = MinHashLSHIndex(threshold=0.8)
+    minhash_index.add_many(['Large language models in clinical practice: a systematic review', 'Deep learning for retinal imaging'])
+    assert minhash_index.find('Large Language Models in Clinical Practice - A Systematic Review.') == 0
+    assert minhash_index.find('Reinforcement learning for robotic surgery') is None
+
+def test_minhash_filter_articles_within_run():
+    minhash_index = MinHashLSHIndex(threshold=0.8)
+    articles = [
+        Article(title='ChatGPT for patient education: a cross-sectional study'),
+        Article(title='ChatGPT for patient education - a cross sectional study'),
+        Article(title=''),
+        Article(title='Unrelated work on protein folding')
+    ]
+    kept_articles = minhash_index.filter_articles(articles)
+    assert [article.title for article in kept_articles] == [articles[0].title, '', articles[3].title]
+
+def test_embedding_lsh_finds_near_duplicates():
+    embedding_index = EmbeddingLSHIndex(BagOfWordsEncoder(), threshold=0.9)
+    embedding_index.add_many(['Large language models for clinical question answering', ''])
+    assert len(embedding_index.vectors) == 1
+    assert embedding_index.find('large language models for clinical question answering.') == 0
+    assert embedding_index.find('Menopause symptom tracking with wearables') is None
+
+def test_embedding_lsh_dimension_from_encoder():
+    embedding_index = EmbeddingLSHIndex(BagOfWordsEncoder(dim=20), num_tables=4, num_bits=6)
+    embedding_index.add_many(['a title'])
+    assert embedding_index.hyperplanes.shape == (4, 6, 20)
+
+def test_embedding_lsh_filter_articles():
+    embedding_index = make_near_duplicate_index("embedding", threshold=0.9, encoder=BagOfWordsEncoder())
+    embedding_index.add_many(['Hallucination in discharge summaries written by language models'])
+    articles = [
+        Article(title='Hallucination in discharge summaries written by language models'),
+        Article(title='Wearables for menopause symptom tracking'),
+        Article(title='Wearables for Menopause Symptom Tracking'),
+        Article(title='')
+    ]
+    kept_articles = embedding_index.filter_articles(articles)
+    assert [article.title for article in kept_articles] == ['Wearables for menopause symptom tracking', '']
+
+def test_embedding_lsh_seeded_through_store(tmp_path):
+    #only titles missing from the store are encoded, so a second run re-encodes nothing
+    sheet_titles = ['Paper one on language models', 'Paper two on menopause', 'Paper three on wearables']
+    encoder = BagOfWordsEncoder()
+    for _ in range(2):
+        embedding_store = EmbeddingStore(str(tmp_path), 'bag-of-words')
+        embedding_index = make_near_duplicate_index("embedding", encoder=encoder, embedding_store=embedding_store)
+        embedding_index.add_many(sheet_titles)
+        assert embedding_index.find('paper two on  menopause') == 1
+    assert encoder.n_encoded == len(sheet_titles)
+
+def test_make_near_duplicate_index_unknown_mode():
+    with pytest.raises(ValueError):
+        make_near_duplicate_index("fuzzy")
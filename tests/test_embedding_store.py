@@ -0,0 +1,79 @@
+import sys
+import threading
+import numpy as np
+import pytest
+from embedding_store import EmbeddingStore
+
+class CountingEncoder:
+    def __init__(self, dim=8):
+        self.dim = dim
+        self.n_encoded = 0
+
+    def encode(self, sentences, batch_size=32):
+        self.n_encoded += len(sentences)
+        return np.array([[len(sentence) + col for col in range(self.dim)] for sentence in sentences], dtype=np.float32)
+
+def test_encode_only_missing_texts(tmp_path):
+    encoder = CountingEncoder()
+    embedding_store = EmbeddingStore(str(tmp_path), 'counting-encoder')
+    first = embedding_store.encode(['Paper one', 'Paper two', 'paper  ONE'], encoder)
+    assert encoder.n_encoded == 2
+    assert first.shape == (3, 8)
+    np.testing.assert_array_equal(first[0], first[2])
+
+    second = embedding_store.encode(['Paper two', 'Paper three'], encoder)
+    assert encoder.n_encoded == 3
+    np.testing.assert_array_equal(second[0], first[1])
+    assert embedding_store.stats() == {'rows': 3, 'hits': 2, 'misses': 3}
+
+def test_store_reloads_from_disk(tmp_path):
+    encoder = CountingEncoder()
+    embeddings = EmbeddingStore(str(tmp_path), 'counting-encoder').encode(['Paper one', 'Paper two'], encoder)
+    reloaded_store = EmbeddingStore(str(tmp_path), 'counting-encoder')
+    assert len(reloaded_store) == 2
+    assert 'paper one' in reloaded_store
+    np.testing.assert_array_equal(reloaded_store.get_many(['Paper two', 'Paper one']), embeddings[::-1])
+
+def test_store_ignores_partial_append(tmp_path):
+    embedding_store = EmbeddingStore(str(tmp_path), 'counting-encoder')
+    embedding_store.encode(['Paper one'], CountingEncoder())
+    #an embedding row written without its id, e.g. the process was killed mid append
+    with open(embedding_store.embeddings_filepath, 'ab') as f:
+        f.write(np.zeros(8, dtype=np.float32).tobytes())
+    assert len(EmbeddingStore(str(tmp_path), 'counting-encoder')) == 1
+
+def test_store_rejects_other_dimension(tmp_path):
+    embedding_store = EmbeddingStore(str(tmp_path), 'counting-encoder')
+    embedding_store.encode(['Paper one'], CountingEncoder(dim=8))
+    with pytest.raises(ValueError):
+        embedding_store.encode(['Paper two'], CountingEncoder(dim=4))
+
+def test_concurrent_encode(tmp_path):
+    #threads encoding overlapping new texts must never see a row past the mapped matrix
+    #a tiny switch interval makes the threads interleave inside append / get_many
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    embedding_store = EmbeddingStore(str(tmp_path), 'counting-encoder')
+    errors = []
+
+    def worker(offset):
+        try:
+            for batch in range(100):
+                texts = [f'Paper {batch} {idx}' for idx in range(offset, offset + 5)]
+                embeddings = embedding_store.encode(texts, CountingEncoder())
+                assert embeddings.shape == (5, 8)
+                np.testing.assert_array_equal(embeddings[:, 0], [len(text) for text in texts])
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(offset,)) for offset in range(8)]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(switch_interval)
+    assert errors == []
+    assert len(embedding_store) == 100 * 12
+    assert len(EmbeddingStore(str(tmp_path), 'counting-encoder')) == 100 * 12
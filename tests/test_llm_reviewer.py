@@ -0,0 +1,147 @@
+#LLMReviewer against the local OpenAI stand-in from the benchmark suite
+import time
+import openai
+import pytest
+import llm_reviewer
+from llm_reviewer import LLMResponseCache, LLMReviewer
+from benchmarks.fake_services import FakeOpenAI
+
+@pytest.fixture
+def fake_openai(monkeypatch):
+    monkeypatch.setenv('OPENAI_API_KEY', 'test')
+    service = FakeOpenAI().start()
+    yield service
+    service.stop()
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(llm_reviewer.time, 'sleep', sleeps.append)
+    return sleeps
+
+def make_reviewer(fake_openai, **kwargs):
+    return LLMReviewer('Does the abstract mention menopause symptoms?', api_base=fake_openai.api_base, **kwargs)
+
+def test_review(fake_openai):
+    response_content = make_reviewer(fake_openai).review('Hot flushes were assessed.')
+    assert response_content in ('No', 'Yes: Menopause symptoms were assessed.')
+    assert fake_openai.stats()['calls'] == {'completions': 1}
+
+def test_retries_rate_limit_and_server_errors(fake_openai, sleeps):
+    fake_openai.error_statuses = [429, 500, 503]
+    make_reviewer(fake_openai).review('Hot flushes were assessed.')
+    assert fake_openai.stats()['total_calls'] == 4
+    #exponential backoff with up to a second of jitter
+    assert [int(sleep) for sleep in sleeps] == [1, 2, 4]
+
+@pytest.mark.parametrize('status', [400, 422])
+def test_does_not_retry_client_errors(fake_openai, sleeps, status):
+    fake_openai.error_statuses = [status]
+    with pytest.raises(openai.error.OpenAIError):
+        make_reviewer(fake_openai).review('Hot flushes were assessed.')
+    assert fake_openai.stats()['total_calls'] == 1
+    assert sleeps == []
+
+def test_gives_up_after_max_retries(fake_openai, sleeps):
+    fake_openai.error_statuses = [429] * 10
+    with pytest.raises(openai.error.RateLimitError):
+        make_reviewer(fake_openai, max_retries=2).review('Hot flushes were assessed.')
+    assert fake_openai.stats()['total_calls'] == 3
+    assert len(sleeps) == 2
+
+def test_requests_limited_by_token_bucket(fake_openai):
+    #600 requests/min refills 10 per second once the initial burst is spent
+    reviewer = make_reviewer(fake_openai, requests_per_minute=600)
+    reviewer.request_limiter.acquire(600)
+    start = time.monotonic()
+    for idx in range(3):
+        reviewer.review(f'Abstract {idx}')
+    assert time.monotonic() - start >= 0.25
+    assert fake_openai.stats()['total_calls'] == 3
+
+def test_tokens_limited_by_token_bucket(fake_openai):
+    #prompts are estimated at ~4 characters per token against the tokens/min bucket
+    reviewer = make_reviewer(fake_openai, tokens_per_minute=6000)
+    reviewer.token_limiter.acquire(6000)
+    start = time.monotonic()
+    reviewer.review('x' * 200)
+    assert time.monotonic() - start >= 0.5
+
+class FakeClock:
+    def __init__(self, now=1700000000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(llm_reviewer.time, 'time', clock.time)
+    return clock
+
+def read_accessed_at(cache, key):
+    return cache.connection.execute("SELECT accessed_at FROM responses WHERE key = ?", (key,)).fetchone()[0]
+
+def test_cache_hits_and_misses(tmp_path, clock):
+    cache = LLMResponseCache(str(tmp_path / 'llm_cache.sqlite'))
+    key = cache.make_key('gpt-3.5-turbo', 'system prompt', 'message')
+    assert cache.get(key) is None
+    cache.put(key, 'No')
+    assert cache.get(key) == 'No'
+    assert cache.get(cache.make_key('gpt-3.5-turbo', 'system prompt', 'another message')) is None
+    assert cache.stats() == {'hits': 1, 'misses': 2}
+
+def test_cache_persists_between_runs(tmp_path, clock):
+    cache_path = str(tmp_path / 'llm_cache.sqlite')
+    LLMResponseCache(cache_path).put('key', 'Yes: hot flushes')
+    assert LLMResponseCache(cache_path).get('key') == 'Yes: hot flushes'
+
+def test_cache_ttl_expiry(tmp_path, clock):
+    cache_path = str(tmp_path / 'llm_cache.sqlite')
+    cache = LLMResponseCache(cache_path, ttl_seconds=60)
+    cache.put('key', 'No')
+    clock.now += 59
+    assert cache.get('key') == 'No'
+    clock.now += 2
+    assert cache.get('key') is None
+    #expired entries are deleted when the cache is next opened
+    LLMResponseCache(cache_path, ttl_seconds=60)
+    assert cache.connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0] == 0
+
+def test_cache_evicts_least_recently_used_in_a_batch(tmp_path, clock):
+    cache = LLMResponseCache(str(tmp_path / 'llm_cache.sqlite'), max_entries=10)
+    for idx in range(10):
+        clock.now += 1
+        cache.put(f'key{idx}', 'No')
+    #the oldest entry was read recently so it outlives key1 and key2
+    clock.now += 1
+    assert cache.get('key0') == 'No'
+    clock.now += 1
+    cache.put('key10', 'No')
+    #one put past max_entries evicts down to max_entries less a tenth, so the next put does not evict again
+    keys = {row[0] for row in cache.connection.execute("SELECT key FROM responses")}
+    assert keys == {'key0'} | {f'key{idx}' for idx in range(3, 11)}
+    cache.put('key11', 'No')
+    assert cache.connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0] == 10
+
+def test_cache_batches_access_time_writes(tmp_path, clock):
+    cache = LLMResponseCache(str(tmp_path / 'llm_cache.sqlite'), access_batch_size=3)
+    cache.put('key', 'No')
+    put_at = clock.now
+    clock.now += 1
+    cache.get('key')
+    #hits are held in memory until the next put, a full batch or flush
+    assert read_accessed_at(cache, 'key') == put_at
+    cache.flush()
+    assert read_accessed_at(cache, 'key') == put_at + 1
+
+    #the third distinct key read fills the batch
+    for key in ['other', 'third']:
+        cache.put(key, 'No')
+    clock.now += 1
+    for key in ['key', 'other', 'third']:
+        assert read_accessed_at(cache, key) < clock.now
+        cache.get(key)
+    assert [read_accessed_at(cache, key) for key in ['key', 'other', 'third']] == [clock.now] * 3
+    assert cache.pending_accesses == {}
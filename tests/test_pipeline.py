@@ -0,0 +1,140 @@
+import threading
+import time
+import pytest
+import instrumentation as im
+from pipeline import Pipeline, ReorderBuffer, Stage
+
+@pytest.fixture(autouse=True)
+def reset_instrumentation():
+    im.reset()
+
+def test_pipeline_runs_every_item_through_every_stage():
+    outputs = []
+    outputs_lock = threading.Lock()
+
+    def square(item, emit):
+        emit(item * item)
+
+    def collect(item, emit):
+        with outputs_lock:
+            outputs.append(item)
+
+    Pipeline([
+        Stage("square", square, workers=4, queue_size=2),
+        Stage("collect", collect, workers=2, queue_size=2)
+    ]).run(range(200))
+    assert sorted(outputs) == [item * item for item in range(200)]
+
+def test_pipeline_finish_runs_once_after_all_workers():
+    batches = []
+    pending = []
+    pending_lock = threading.Lock()
+
+    def buffer(item, emit):
+        with pending_lock:
+            pending.append(item)
+            if len(pending) == 10:
+                emit(list(pending))
+                pending.clear()
+
+    def flush(emit):
+        #only the last worker of the stage gets here, once every item has been buffered
+        with pending_lock:
+            if pending:
+                emit(list(pending))
+                pending.clear()
+
+    finish_calls = []
+    Pipeline([
+        Stage("buffer", buffer, workers=3, finish=lambda emit: (finish_calls.append(1), flush(emit))),
+        Stage("sink", lambda batch, emit: batches.append(batch))
+    ]).run(range(25))
+    assert len(finish_calls) == 1
+    assert sorted(item for batch in batches for item in batch) == list(range(25))
+    assert [len(batch) for batch in batches] == [10, 10, 5]
+
+def test_pipeline_fan_out():
+    outputs = []
+    Pipeline([
+        Stage("split", lambda item, emit: [emit(part) for part in item.split()], workers=2),
+        Stage("collect", lambda item, emit: outputs.append(item))
+    ]).run(["a b", "c", "d e f"])
+    assert sorted(outputs) == ["a", "b", "c", "d", "e", "f"]
+
+def test_pipeline_stage_failure_stops_the_run():
+    processed = []
+
+    def fail_on_third(item, emit):
+        if item == 3:
+            raise ValueError("bad item")
+        emit(item)
+
+    def slow_sink(item, emit):
+        time.sleep(0.01)
+        processed.append(item)
+
+    #tiny queues so upstream is blocked on a full queue when the failure happens - run must still return
+    pipeline = Pipeline([
+        Stage("source", lambda item, emit: emit(item), queue_size=1),
+        Stage("check", fail_on_third, queue_size=1),
+        Stage("sink", slow_sink, queue_size=1)
+    ])
+    start = time.monotonic()
+    with pytest.raises(ValueError, match="bad item"):
+        pipeline.run(range(1000))
+    assert time.monotonic() - start < 5
+    assert pipeline.stop_event.is_set()
+    assert 3 not in processed
+    assert len(processed) < 1000
+
+def test_pipeline_finish_skipped_after_failure():
+    finish_calls = []
+
+    def fail(item, emit):
+        raise RuntimeError("stage failed")
+
+    pipeline = Pipeline([
+        Stage("fail", fail, workers=2),
+        Stage("sink", lambda item, emit: None, finish=lambda emit: finish_calls.append(1))
+    ])
+    with pytest.raises(RuntimeError):
+        pipeline.run(range(10))
+    #a partial batch is not flushed once a stage has failed
+    assert finish_calls == []
+
+def test_pipeline_stage_timers():
+    Pipeline([Stage("noop", lambda item, emit: None)]).run(range(5))
+    assert "stage.noop" in im.run_report()["timers"]
+
+def test_pipeline_failure_stops_producers():
+    #a paging search keeps yielding until emit tells it the pipeline has stopped
+    pages_fetched = []
+
+    def paging_search(item, emit):
+        for page in range(100000):
+            pages_fetched.append(page)
+            emit(page)
+
+    def fail_on_tenth(item, emit):
+        if item == 10:
+            raise ValueError("bad page")
+
+    pipeline = Pipeline([
+        Stage("search", paging_search, queue_size=1),
+        Stage("check", fail_on_tenth, queue_size=1)
+    ])
+    with pytest.raises(ValueError, match="bad page"):
+        pipeline.run(["query"])
+    #at most the items already queued when the check failed
+    assert len(pages_fetched) < 20
+
+def test_reorder_buffer_releases_in_task_then_seq_order():
+    reorder_buffer = ReorderBuffer(3)
+    assert reorder_buffer.add(1, 0, 'b0') == []
+    assert reorder_buffer.add(0, 1, 'a1') == []
+    assert reorder_buffer.finish_task(1, 1) == []
+    assert reorder_buffer.add(0, 0, 'a0') == ['a0', 'a1']
+    #task 0 is only complete once its size is known
+    assert reorder_buffer.finish_task(2, 0) == []
+    assert reorder_buffer.finish_task(0, 2) == ['b0']
+    assert reorder_buffer.next_task == 3
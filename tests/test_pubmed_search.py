@@ -0,0 +1,187 @@
+#PubMedSearch against recorded E-utilities responses served from a local HTTP server
+import http.server
+import os
+import threading
+import urllib.parse
+import xml.etree.ElementTree as ET
+import pytest
+import requests
+import pubmed_search
+from pubmed_search import PubMedSearch
+
+FIXTURES_DIRPATH = os.path.join(os.path.dirname(__file__), 'fixtures')
+#esearch returns newest first - the efetch fixture holds the same articles oldest first
+ESEARCH_IDS = ['38012345', '38011111', '37999999', '37950000', '37900001']
+
+def read_fixture(filename):
+    with open(os.path.join(FIXTURES_DIRPATH, filename), 'rb') as f:
+        return f.read()
+
+class RecordedEutilsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        parsed = urllib.parse.urlparse(self.path)
+        params = {key: values[0] for key, values in urllib.parse.parse_qs(parsed.query).items()}
+        endpoint = parsed.path.rsplit('/', 1)[-1]
+        self.server.requests.append((endpoint, params))
+
+        error_statuses = self.server.error_statuses.get(endpoint)
+        if error_statuses:
+            #E-utilities answers rate limited requests with a JSON body
+            self.send_error_response(error_statuses.pop(0))
+            return
+        if endpoint == 'esearch.fcgi':
+            #the recorded IdList, paged by retstart / retmax - Count stays the total
+            root = ET.fromstring(read_fixture('pubmed_esearch.xml'))
+            id_list_elem = root.find('./IdList')
+            retstart, retmax = int(params.get('retstart', 0)), int(params.get('retmax', 20))
+            for idx, id_elem in enumerate(list(id_list_elem)):
+                if not retstart <= idx < retstart + retmax:
+                    id_list_elem.remove(id_elem)
+            payload = ET.tostring(root)
+        elif endpoint == 'efetch.fcgi':
+            #efetch only returns the requested IDs, in its own (fixture) order
+            requested_ids = set(params['id'].split(','))
+            root = ET.fromstring(read_fixture('pubmed_efetch.xml'))
+            for article_elem in list(root):
+                if article_elem.find('./MedlineCitation/PMID').text not in requested_ids:
+                    root.remove(article_elem)
+            payload = ET.tostring(root)
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/xml')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def send_error_response(self, status):
+        payload = b'{"error":"API rate limit exceeded","count":"4"}'
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def eutils_server(monkeypatch):
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), RecordedEutilsHandler)
+    server.requests = []
+    #statuses returned, in order, per endpoint before the fixtures are served
+    server.error_statuses = {}
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv('PUBMED_BASE_URL', f'http://127.0.0.1:{server.server_address[1]}/')
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def test_search_keeps_esearch_order(eutils_server):
+    articles = PubMedSearch('large language model', max_results=5).search()
+    assert [article.link.rsplit('/', 1)[-1] for article in articles] == ESEARCH_IDS
+
+def test_search_fetches_in_chunks(eutils_server):
+    PubMedSearch('large language model', max_results=5, fetch_chunk_size=2).search()
+    endpoints = [endpoint for endpoint, _ in eutils_server.requests]
+    assert endpoints == ['esearch.fcgi', 'efetch.fcgi', 'efetch.fcgi', 'efetch.fcgi']
+    fetched_ids = [params['id'] for endpoint, params in eutils_server.requests if endpoint == 'efetch.fcgi']
+    assert fetched_ids == ['38012345,38011111', '37999999,37950000', '37900001']
+
+def test_search_params(eutils_server):
+    PubMedSearch('large language model', max_results=5, min_date='2023/11/01', max_date='2023/12/31', date_type='edat').search()
+    _, params = eutils_server.requests[0]
+    assert params['term'] == 'large language model'
+    assert params['retmax'] == '5'
+    assert (params['mindate'], params['maxdate'], params['datetype']) == ('2023/11/01', '2023/12/31', 'edat')
+
+def test_search_output_shape(eutils_server):
+    articles = PubMedSearch('large language model', max_results=5).search()
+    article = articles[0]
+    assert article.title == 'Large language models and menopause symptom triage: a cross-sectional study.'
+    assert article.abstract == 'Hot flushes and sleep disturbance were triaged by three chatbots.'
+    assert article.published == '2023-Dec-05'
+    assert article.link == 'https://pubmed.ncbi.nlm.nih.gov/38012345'
+    assert article.source == 'PubMed'
+    assert article.doi == '10.2196/50001'
+
+    #missing abstract, day and DOI come back as empty strings rather than failing the run
+    articles_by_link = {article.link: article for article in articles}
+    assert articles_by_link['https://pubmed.ncbi.nlm.nih.gov/37950000'].abstract == ''
+    assert articles_by_link['https://pubmed.ncbi.nlm.nih.gov/37900001'].published == '2023-Oct-'
+    assert articles_by_link['https://pubmed.ncbi.nlm.nih.gov/38011111'].doi == ''
+    #structured abstracts keep their first section
+    assert articles_by_link['https://pubmed.ncbi.nlm.nih.gov/37999999'].abstract == 'Large language models are increasingly used in clinical settings.'
+
+def test_pmid_from_medline_citation(eutils_server):
+    #reference lists and comments carry their own PubMed IDs, which must not be taken as the article's
+    articles = PubMedSearch('large language model', max_results=5).search()
+    links = {article.link for article in articles}
+    assert 'https://pubmed.ncbi.nlm.nih.gov/36000001' not in links
+    assert 'https://pubmed.ncbi.nlm.nih.gov/37438534' not in links
+    assert 'https://pubmed.ncbi.nlm.nih.gov/37960001' not in links
+    assert len(links) == len(ESEARCH_IDS)
+
+def test_pmid_falls_back_to_article_id():
+    article_elem = ET.fromstring(
+        '<PubmedArticle><MedlineCitation><Article><ArticleTitle>No PMID element</ArticleTitle></Article></MedlineCitation>'
+        '<PubmedData><ArticleIdList><ArticleId IdType="pubmed">31234567</ArticleId></ArticleIdList></PubmedData></PubmedArticle>'
+    )
+    article_id, article = PubMedSearch('query').parse_article(article_elem)
+    assert article_id == '31234567'
+    assert article.link == 'https://pubmed.ncbi.nlm.nih.gov/31234567'
+
+def test_rate_limiter_called_per_request(eutils_server):
+    class CountingLimiter:
+        calls = 0
+        def wait(self):
+            self.calls += 1
+    rate_limiter = CountingLimiter()
+    PubMedSearch('large language model', max_results=5, fetch_chunk_size=2, rate_limiter=rate_limiter).search()
+    assert rate_limiter.calls == len(eutils_server.requests) == 4
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(pubmed_search.time, 'sleep', sleeps.append)
+    return sleeps
+
+def test_search_retries_rate_limit_and_server_errors(eutils_server, sleeps):
+    #esearch is rate limited once, the first efetch gets a 429 then a 502
+    eutils_server.error_statuses = {'esearch.fcgi': [429], 'efetch.fcgi': [429, 502]}
+    articles = PubMedSearch('large language model', max_results=5, fetch_chunk_size=3).search()
+    assert [article.link.rsplit('/', 1)[-1] for article in articles] == ESEARCH_IDS
+    endpoints = [endpoint for endpoint, _ in eutils_server.requests]
+    assert endpoints == ['esearch.fcgi', 'esearch.fcgi', 'efetch.fcgi', 'efetch.fcgi', 'efetch.fcgi', 'efetch.fcgi']
+    #exponential backoff with up to a second of jitter
+    assert [int(sleep) for sleep in sleeps] == [1, 1, 2]
+
+def test_search_does_not_retry_client_errors(eutils_server, sleeps):
+    eutils_server.error_statuses = {'esearch.fcgi': [400]}
+    with pytest.raises(requests.HTTPError):
+        PubMedSearch('large language model', max_results=5).search()
+    assert len(eutils_server.requests) == 1
+    assert sleeps == []
+
+def test_search_gives_up_after_max_retries(eutils_server, sleeps):
+    eutils_server.error_statuses = {'esearch.fcgi': [503] * 10}
+    with pytest.raises(requests.HTTPError):
+        PubMedSearch('large language model', max_results=5, max_retries=2).search()
+    assert len(eutils_server.requests) == 3
+    assert len(sleeps) == 2
+
+def test_search_pages_esearch_until_count(eutils_server):
+    pubmed_search = PubMedSearch('large language model', max_results=100, search_page_size=2)
+    articles = pubmed_search.search()
+    assert [article.link.rsplit('/', 1)[-1] for article in articles] == ESEARCH_IDS
+    esearch_params = [params for endpoint, params in eutils_server.requests if endpoint == 'esearch.fcgi']
+    assert [(params['retstart'], params['retmax']) for params in esearch_params] == [('0', '2'), ('2', '2'), ('4', '2')]
+    assert pubmed_search.total_count == 5
+    assert not pubmed_search.truncated
+
+def test_search_truncated_by_max_results(eutils_server):
+    pubmed_search = PubMedSearch('large language model', max_results=3)
+    assert len(pubmed_search.search()) == 3
+    assert pubmed_search.truncated
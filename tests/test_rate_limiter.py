@@ -0,0 +1,78 @@
+import threading
+import time
+from rate_limiter import RateLimiter, TokenBucket
+
+def run_threads(target, n_threads):
+    threads = [threading.Thread(target=target) for _ in range(n_threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+def test_rate_limiter_spaces_requests_across_threads():
+    rate_limiter = RateLimiter(100)
+    request_times = []
+    lock = threading.Lock()
+
+    def worker():
+        for _ in range(5):
+            rate_limiter.wait()
+            with lock:
+                request_times.append(time.monotonic())
+
+    start = time.monotonic()
+    run_threads(worker, 8)
+    #40 requests at 100/s - the first goes straight away, the other 39 are 10ms apart
+    assert len(request_times) == 40
+    assert time.monotonic() - start >= 39 * 0.01 * 0.9
+    #each wait returns no earlier than its own slot, so the kth request cannot start before start + k * 10ms
+    request_times.sort()
+    assert all(request_time >= start + idx * 0.01 - 0.002 for idx, request_time in enumerate(request_times))
+
+def test_rate_limiter_does_not_wait_after_idle():
+    rate_limiter = RateLimiter(10)
+    rate_limiter.wait()
+    time.sleep(0.15)
+    start = time.monotonic()
+    rate_limiter.wait()
+    assert time.monotonic() - start < 0.05
+
+def test_token_bucket_starts_full():
+    token_bucket = TokenBucket(600)
+    start = time.monotonic()
+    for _ in range(600):
+        token_bucket.acquire()
+    assert time.monotonic() - start < 0.1
+
+def test_token_bucket_waits_for_refill():
+    #600/min refills 10 tokens per second
+    token_bucket = TokenBucket(600)
+    token_bucket.acquire(600)
+    start = time.monotonic()
+    token_bucket.acquire(3)
+    assert 0.25 <= time.monotonic() - start < 1.0
+
+def test_token_bucket_caps_oversized_requests():
+    token_bucket = TokenBucket(60)
+    start = time.monotonic()
+    token_bucket.acquire(1000)
+    assert time.monotonic() - start < 0.1
+
+def test_token_bucket_never_overspends_across_threads():
+    #3000/min is 50 tokens per second on top of the initial 3000
+    token_bucket = TokenBucket(3000)
+    acquired = []
+    lock = threading.Lock()
+
+    def worker():
+        for _ in range(31):
+            token_bucket.acquire(10)
+            with lock:
+                acquired.append(10)
+
+    start = time.monotonic()
+    run_threads(worker, 10)
+    elapsed = time.monotonic() - start
+    assert sum(acquired) == 3100
+    assert sum(acquired) <= 3000 + elapsed * 50 + 10
+    assert elapsed >= (3100 - 3000) / 50 * 0.9
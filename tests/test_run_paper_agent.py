@@ -0,0 +1,43 @@
+#run_paper_agent end to end with canned search results and an in-memory sheet
+import random
+import time
+import types
+import pytest
+import article_consolidator as ac
+import pipeline
+from article import Article, SHEET_COLUMNS
+from utils import InMemorySheetBackend
+
+QUERIES = ['large language models', 'chatgpt']
+
+def make_config(sheet_backend):
+    config = types.ModuleType('config')
+    config.query_config = {'queries': QUERIES, 'topic_checks': ['clinical', 'safety'], 'max_results': 10, 'search_sources': ['pubmed', 'arxiv']}
+    config.llm_config = {'run_topic_check': False, 'run_relevance_model': False, 'run_relevance_model_path': None}
+    config.setup_config = {'credentials_key_path': '', 'gsheet_key': '', 'gsheet_tab_name': 'papers', 'target_col_num': 1, 'sheet_backend': sheet_backend}
+    config.pipeline_config = {'normalize_workers': 3}
+    return config
+
+@pytest.fixture
+def canned_search(monkeypatch):
+    #every paper is found by both queries and both sources, with random delays so arrival order changes between runs
+    rng = random.Random()
+
+    def iter_source(self, source):
+        for idx in range(20):
+            time.sleep(rng.uniform(0, 0.002))
+            link = f'https://pubmed.ncbi.nlm.nih.gov/{idx}' if source == 'pubmed' else f'http://arxiv.org/abs/2311.{idx:05d}v1'
+            yield Article(title=f'Shared paper {idx}', link=link, source='PubMed' if source == 'pubmed' else 'arXiv')
+
+    monkeypatch.setattr(ac.ArticleConsolidator, 'iter_source', iter_source)
+
+def test_duplicates_resolved_in_query_then_source_order(canned_search):
+    for _ in range(3):
+        sheet_backend = InMemorySheetBackend({'papers': [SHEET_COLUMNS]})
+        pipeline.run_paper_agent(make_config(sheet_backend), '06_12_2023_09_00_00')
+        rows = sheet_backend.tabs['papers'][1:]
+        assert len(rows) == 20
+        #the first query's PubMed copy wins every time
+        assert {row[SHEET_COLUMNS.index('Source')] for row in rows} == {'PubMed'}
+        assert {row[SHEET_COLUMNS.index('Query')] for row in rows} == {QUERIES[0]}
+        assert [row[SHEET_COLUMNS.index('Title')] for row in rows] == [f'Shared paper {idx}' for idx in range(20)]
@@ -0,0 +1,66 @@
+import numpy as np
+from topic_prefilter import TopicPrefilter, make_topic_regex
+
+FILLER = 'Participants were recruited from primary care clinics across three regions. '
+
+class TopicWordEncoder:
+    #stand-in for the SentenceTransformer - sleep texts and bone texts are orthogonal, anything else is in between
+    def encode(self, sentences, batch_size=32):
+        return np.array([[float('sleep' in sentence.lower()), float('bone' in sentence.lower())] if ('sleep' in sentence.lower()) != ('bone' in sentence.lower()) else [1.0, 1.0]
+                         for sentence in sentences], dtype=np.float32)
+
+def test_topic_regex_whole_words_and_separators():
+    topic_regex = make_topic_regex(['hot flushes', 'HRT'])
+    assert topic_regex.search('Severe Hot-flushes were reported')
+    assert topic_regex.search('hot   flushes at night')
+    assert topic_regex.search('women on hrt')
+    assert not topic_regex.search('hot flushesx')
+    assert not topic_regex.search('shrthand')
+
+def test_short_abstract_is_no():
+    topic_prefilter = TopicPrefilter(min_abstract_chars=100)
+    assert topic_prefilter.check('menopause', '').startswith('No')
+    assert topic_prefilter.check('menopause', None).startswith('No')
+    assert topic_prefilter.check('menopause', 'Menopause is mentioned but the abstract is short.').startswith('No')
+    assert topic_prefilter.stats()['short_abstract'] == 3
+
+def test_keyword_match_quotes_sentence():
+    topic_prefilter = TopicPrefilter(min_abstract_chars=10)
+    abstract = FILLER + 'Menopause symptoms were assessed at baseline. Follow-up was 12 months.'
+    assert topic_prefilter.check('menopause', abstract) == 'Yes: Menopause symptoms were assessed at baseline.'
+
+def test_synonym_match():
+    topic_prefilter = TopicPrefilter(min_abstract_chars=10, synonyms={'menopause': ['perimenopause', 'hot flushes']})
+    abstract = FILLER + 'Women reported hot-flushes during the night!'
+    assert topic_prefilter.check('menopause', abstract) == 'Yes: Women reported hot-flushes during the night!'
+
+def test_keyword_match_across_sentence_split():
+    #the topic itself contains a sentence boundary, so no single split sentence matches
+    topic_prefilter = TopicPrefilter(min_abstract_chars=10)
+    abstract = FILLER + "Use of St. John's wort was common. Other supplements were rare."
+    assert topic_prefilter.check("St. John's wort", abstract) == "Yes: Use of St. John's wort was common."
+
+def test_embedding_reject_and_accept_thresholds():
+    topic_prefilter = TopicPrefilter(min_abstract_chars=10, encoder=TopicWordEncoder(), reject_threshold=0.3, accept_threshold=0.9)
+    assert topic_prefilter.check('sleep quality', FILLER + 'Bone density was measured.') == 'No (prefilter: topic similarity 0.00)'
+    assert topic_prefilter.check('sleep quality', FILLER + 'Sleep was measured.') == 'Yes (prefilter: topic similarity 1.00)'
+    #similarity ~0.71 is between the thresholds, so the LLM decides
+    assert topic_prefilter.check('sleep quality', FILLER + 'Diet was measured.') is None
+
+def test_reject_threshold_only():
+    topic_prefilter = TopicPrefilter(min_abstract_chars=10, encoder=TopicWordEncoder(), reject_threshold=0.3)
+    assert topic_prefilter.check('sleep quality', FILLER + 'Sleep was measured.') is None
+    assert topic_prefilter.check('sleep quality', FILLER + 'Bone density was measured.').startswith('No')
+
+def test_embedding_stage_skipped_without_thresholds():
+    topic_prefilter = TopicPrefilter(min_abstract_chars=10, encoder=TopicWordEncoder())
+    assert topic_prefilter.check('sleep quality', FILLER + 'Bone density was measured.') is None
+
+def test_counters():
+    topic_prefilter = TopicPrefilter(min_abstract_chars=10, encoder=TopicWordEncoder(), reject_threshold=0.3, accept_threshold=0.9)
+    topic_prefilter.check('sleep quality', '')
+    topic_prefilter.check('sleep quality', FILLER + 'Poor sleep quality was common.')
+    topic_prefilter.check('sleep quality', FILLER + 'Bone density was measured.')
+    topic_prefilter.check('sleep quality', FILLER + 'Sleep was measured.')
+    topic_prefilter.check('sleep quality', FILLER + 'Diet was measured.')
+    assert topic_prefilter.stats() == {'short_abstract': 1, 'keyword_match': 1, 'embedding_reject': 1, 'embedding_accept': 1, 'llm': 1}
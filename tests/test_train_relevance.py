@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+import relevance_model as rm
+import train_relevance as tr
+
+class KeywordEncoder:
+    #separable stand-in for the SentenceTransformer - relevant titles mention "language model"
+    def encode(self, sentences, batch_size=32):
+        return np.array([[float('language model' in sentence.lower()), len(sentence) / 100, 1.0] for sentence in sentences], dtype=np.float32)
+
+def make_rows(n_rows):
+    rows = []
+    for idx in range(n_rows):
+        relevant = idx % 3 == 0
+        title = f'Large language model study {idx}' if relevant else f'Cohort study of bone density {idx}'
+        rows.append({'Title': title, 'Query': 'llm', 'Relevant?': 'Y' if relevant else 'N'})
+    return rows
+
+@pytest.fixture
+def rows(monkeypatch):
+    monkeypatch.setitem(rm._encoders, 'keyword-encoder', KeywordEncoder())
+    return make_rows(30)
+
+def test_artifact_round_trip(rows, tmp_path):
+    version_dirpath = tr.train_relevance(rows, 'keyword-encoder', families=('logreg',), n_folds=3, n_jobs=1, output_dir=str(tmp_path))
+    model, metadata, training_keys = tr.load_artifact(version_dirpath)
+    assert metadata['encoder_id'] == 'keyword-encoder'
+    assert metadata['family'] == 'logreg'
+    assert len(training_keys) == len(rows)
+    assert rm.get_relevance_metadata(str(tmp_path / metadata['version'] / tr.MODEL_FILENAME))['version'] == metadata['version']
+
+def test_runs_in_the_same_second_get_their_own_versions(rows, tmp_path):
+    version_dirpaths = [tr.train_relevance(rows, 'keyword-encoder', families=('logreg',), n_folds=3, n_jobs=1, output_dir=str(tmp_path)) for _ in range(3)]
+    assert len(set(version_dirpaths)) == 3
+    assert sorted(path.name for path in tmp_path.iterdir()) == sorted(dirpath.rsplit('/', 1)[-1] for dirpath in version_dirpaths)
+
+@pytest.mark.parametrize('family', ['logreg', 'sgd'])
+def test_warm_start_from_previous_version(rows, tmp_path, family):
+    previous_dirpath = tr.train_relevance(rows[:21], 'keyword-encoder', families=(family,), n_folds=3, n_jobs=1, output_dir=str(tmp_path))
+    previous_model, previous_metadata, _ = tr.load_artifact(previous_dirpath)
+    #the encoder and fields come from the previous version rather than the arguments
+    version_dirpath = tr.train_relevance(rows, 'unused-encoder', families=('logreg_balanced',), n_folds=3, n_jobs=1, output_dir=str(tmp_path), warm_start_from=previous_dirpath)
+    model, metadata, training_keys = tr.load_artifact(version_dirpath)
+    assert metadata['parent_version'] == previous_metadata['version']
+    assert (metadata['family'], metadata['encoder_id'], metadata['n_train']) == (family, 'keyword-encoder', 30)
+    assert len(training_keys) == 30
+    assert not np.array_equal(model.coef_, previous_model.coef_)
+    features = rm.make_relevance_features(tr.rows_to_articles(rows), KeywordEncoder())
+    assert (model.predict(features) == tr.rows_to_labels(rows)).all()
+
+def test_sgd_warm_start_only_fits_new_rows(rows, tmp_path, monkeypatch):
+    previous_dirpath = tr.train_relevance(rows[:21], 'keyword-encoder', families=('sgd',), n_folds=3, n_jobs=1, output_dir=str(tmp_path))
+    partial_fit_rows = []
+    original_partial_fit = tr.SGDClassifier.partial_fit
+    def partial_fit(self, features, labels, *args, **kwargs):
+        partial_fit_rows.append(len(features))
+        return original_partial_fit(self, features, labels, *args, **kwargs)
+    monkeypatch.setattr(tr.SGDClassifier, 'partial_fit', partial_fit)
+    tr.train_relevance(rows, 'keyword-encoder', n_jobs=1, output_dir=str(tmp_path), warm_start_from=previous_dirpath, run_cv=False)
+    assert partial_fit_rows == [9]
+
+def test_warm_start_without_new_labels(rows, tmp_path):
+    previous_dirpath = tr.train_relevance(rows, 'keyword-encoder', families=('logreg',), n_folds=3, n_jobs=1, output_dir=str(tmp_path))
+    assert tr.train_relevance(rows, 'keyword-encoder', output_dir=str(tmp_path), warm_start_from=previous_dirpath) == previous_dirpath
+    assert len(list(tmp_path.iterdir())) == 1
+
+def test_xgboost_warm_start_continues_boosting(rows):
+    pytest.importorskip('xgboost')
+    features = rm.make_relevance_features(tr.rows_to_articles(rows), KeywordEncoder())
+    labels = tr.rows_to_labels(rows)
+    previous_model = tr.make_model('xgboost').set_params(n_estimators=5).fit(features[:21], labels[:21])
+    model = tr.warm_start_model(previous_model, features, labels, np.arange(21, 30))
+    assert model.get_booster().num_boosted_rounds() == 10
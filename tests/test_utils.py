@@ -0,0 +1,92 @@
+import gspread
+import pytest
+import requests
+import utils
+from article import Article
+from utils import InMemorySheetBackend, SheetStore, parse_relevance_preds, parse_relevance_probs
+
+def make_api_error(status_code):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = b'{"error": {"code": %d, "message": "error", "status": "ERROR"}}' % status_code
+    return gspread.exceptions.APIError(response)
+
+class FailingSheetBackend(InMemorySheetBackend):
+    #raises the given API errors on the first appends (None appends as normal), then appends as normal
+    def __init__(self, status_codes):
+        super().__init__()
+        self.status_codes = list(status_codes)
+        self.attempts = 0
+
+    def values_append(self, gsheet_tab_name, rows):
+        self.attempts += 1
+        status_code = self.status_codes.pop(0) if self.status_codes else None
+        if status_code is not None:
+            raise make_api_error(status_code)
+        return super().values_append(gsheet_tab_name, rows)
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(utils.time, 'sleep', sleeps.append)
+    return sleeps
+
+def test_flush_batches_rows(sleeps):
+    backend = InMemorySheetBackend()
+    sheet_store = SheetStore(backend, 'papers', max_rows_per_append=2)
+    sheet_store.append_articles([Article(title=f'Paper {idx}') for idx in range(5)])
+    assert sheet_store.flush() == 5
+    assert backend.append_calls == 3
+    assert [row[0] for row in backend.tabs['papers']] == [f'Paper {idx}' for idx in range(5)]
+    assert sheet_store.flush() == 0
+    assert sleeps == []
+
+@pytest.mark.parametrize('status_code', [429, 500, 503])
+def test_append_retries_quota_and_server_errors(sleeps, status_code):
+    backend = FailingSheetBackend([status_code, status_code])
+    sheet_store = SheetStore(backend, 'papers')
+    sheet_store.append_articles([Article(title='Paper')])
+    sheet_store.flush()
+    assert backend.attempts == 3
+    assert len(backend.tabs['papers']) == 1
+    #exponential backoff with up to a second of jitter
+    assert 1 <= sleeps[0] < 2 and 2 <= sleeps[1] < 3
+
+def test_append_does_not_retry_client_errors(sleeps):
+    backend = FailingSheetBackend([400])
+    sheet_store = SheetStore(backend, 'papers')
+    sheet_store.append_articles([Article(title='Paper')])
+    with pytest.raises(gspread.exceptions.APIError):
+        sheet_store.flush()
+    assert backend.attempts == 1
+    assert sleeps == []
+
+def test_append_gives_up_after_max_retries(sleeps):
+    backend = FailingSheetBackend([429] * 10)
+    sheet_store = SheetStore(backend, 'papers', max_retries=3)
+    sheet_store.append_articles([Article(title='Paper')])
+    with pytest.raises(gspread.exceptions.APIError):
+        sheet_store.flush()
+    assert backend.attempts == 4
+    assert len(sleeps) == 3
+
+def test_flush_keeps_only_unwritten_rows_after_failure(sleeps):
+    #the second chunk fails with a client error - a retried flush must not append the first chunk again
+    backend = FailingSheetBackend([None, 400])
+    sheet_store = SheetStore(backend, 'papers', max_rows_per_append=2)
+    sheet_store.append_articles([Article(title=f'Paper {idx}') for idx in range(5)])
+    with pytest.raises(gspread.exceptions.APIError):
+        sheet_store.flush()
+    assert [row[0] for row in sheet_store.pending_rows] == ['Paper 2', 'Paper 3', 'Paper 4']
+    assert sheet_store.flush() == 3
+    assert [row[0] for row in backend.tabs['papers']] == [f'Paper {idx}' for idx in range(5)]
+
+def test_get_col_lists():
+    backend = InMemorySheetBackend({'papers': [['Title', 'Abstract', 'Published', 'Link'], ['Paper one', '', '', 'https://pubmed.ncbi.nlm.nih.gov/1'], ['Paper two']]})
+    titles, links = SheetStore(backend, 'papers').get_col_lists([1, 4])
+    assert titles == ['Title', 'Paper one', 'Paper two']
+    assert links == ['Link', 'https://pubmed.ncbi.nlm.nih.gov/1', '']
+
+def test_parse_relevance():
+    assert parse_relevance_preds([[1], [0], [1]]) == ['Y', 'N', 'Y']
+    assert parse_relevance_probs([0.2, 0.5, 0.9], threshold=0.5) == ['N', 'Y', 'Y']
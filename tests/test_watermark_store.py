@@ -0,0 +1,56 @@
+import json
+import threading
+from watermark_store import WatermarkStore
+
+def test_watermarks_only_persisted_on_save(tmp_path):
+    watermark_path = str(tmp_path / 'watermarks.json')
+    watermark_store = WatermarkStore(watermark_path)
+    assert watermark_store.get('menopause', 'pubmed') is None
+
+    watermark_store.update('menopause', 'pubmed', '2023/12/01')
+    #a failed run must not move the watermark past articles it never wrote
+    assert watermark_store.get('menopause', 'pubmed') is None
+    assert WatermarkStore(watermark_path).get('menopause', 'pubmed') is None
+
+    watermark_store.save()
+    assert watermark_store.get('menopause', 'pubmed') == '2023/12/01'
+    assert WatermarkStore(watermark_path).get('menopause', 'pubmed') == '2023/12/01'
+    with open(watermark_path) as f:
+        assert json.load(f) == {'pubmed|menopause': '2023/12/01'}
+
+def test_watermark_only_moves_forward(tmp_path):
+    watermark_store = WatermarkStore(str(tmp_path / 'watermarks.json'))
+    watermark_store.update('llm', 'arxiv', '2023-12-01T10:00:00Z')
+    watermark_store.update('llm', 'arxiv', '2023-11-30T10:00:00Z')
+    watermark_store.update('llm', 'arxiv', None)
+    watermark_store.save()
+    watermark_store.update('llm', 'arxiv', '2023-11-01T00:00:00Z')
+    watermark_store.save()
+    assert watermark_store.get('llm', 'arxiv') == '2023-12-01T10:00:00Z'
+
+def test_watermarks_per_query_and_source(tmp_path):
+    watermark_store = WatermarkStore(str(tmp_path / 'watermarks.json'))
+    watermark_store.update('llm', 'arxiv', '2023-12-01T10:00:00Z')
+    watermark_store.update('llm', 'pubmed', '2023/11/01')
+    watermark_store.update('menopause', 'pubmed', '2023/10/01')
+    watermark_store.save()
+    assert watermark_store.get('llm', 'pubmed') == '2023/11/01'
+    assert watermark_store.get('menopause', 'pubmed') == '2023/10/01'
+    assert watermark_store.get('menopause', 'arxiv') is None
+
+def test_concurrent_updates_keep_the_maximum(tmp_path):
+    watermark_path = str(tmp_path / 'watermarks.json')
+    watermark_store = WatermarkStore(watermark_path)
+
+    def worker(offset):
+        for day in range(offset, 28, 4):
+            watermark_store.update('llm', 'pubmed', f'2023/12/{day + 1:02d}')
+
+    threads = [threading.Thread(target=worker, args=(offset,)) for offset in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    watermark_store.save()
+    assert WatermarkStore(watermark_path).get('llm', 'pubmed') == '2023/12/28'
+    assert not (tmp_path / 'watermarks.json.tmp').exists()
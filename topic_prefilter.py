@@ -0,0 +1,96 @@
+import re
+import threading
+import numpy as np
+
+#sentence boundaries used to quote the matching sentence, in the same "Yes: <sentence>" format as the LLM response
+SENTENCE_SPLIT_REGEX = re.compile(r'(?<=[.!?])\s+')
+
+def make_topic_regex(terms):
+    #case insensitive whole word match of any term, with spaces / hyphens between words treated alike
+    #e.g. "hot flushes" also matches "Hot-flushes" and "hot  flushes"
+    patterns = [r'[\s\-]+'.join(re.escape(word) for word in term.split()) for term in terms if term.strip()]
+    return re.compile(r'\b(?:' + '|'.join(patterns) + r')\b', re.IGNORECASE)
+
+def matching_sentence(abstract, topic_match):
+    #sentence(s) around the match - a match can itself contain a split e.g. "St. John's wort", then the sentences either side are joined
+    sentence_start, sentence_end = 0, len(abstract)
+    for split in SENTENCE_SPLIT_REGEX.finditer(abstract):
+        if split.end() <= topic_match.start():
+            sentence_start = split.end()
+        elif split.start() >= topic_match.end():
+            sentence_end = split.start()
+            break
+    return abstract[sentence_start:sentence_end]
+
+class TopicPrefilter:
+    #cheap cascade in front of the LLM topic check - each stage either answers or passes the article on
+    #  1. short abstract - abstracts shorter than min_abstract_chars (including PubMed's '' when AbstractText is missing) are a "No"
+    #  2. keyword - a whole word match of the topic or one of its synonyms is a "Yes" quoting the matching sentence
+    #  3. embedding - cosine similarity of abstract and topic below reject_threshold is a "No", at or above accept_threshold a "Yes"
+    #anything left is ambiguous and check returns None, so only those articles are sent to the LLM
+    def __init__(self, min_abstract_chars=100, synonyms={}, encoder=None, reject_threshold=None, accept_threshold=None, embedding_store=None, batch_size=32):
+        self.min_abstract_chars = min_abstract_chars
+        #{topic: [synonym, ...]} e.g. {"menopause": ["perimenopause", "climacteric", "hot flushes"]}
+        self.synonyms = synonyms
+        #embedding stage only runs with an encoder and at least one threshold
+        self.encoder = encoder
+        self.reject_threshold = reject_threshold
+        self.accept_threshold = accept_threshold
+        #optional embedding_store.EmbeddingStore so abstracts seen in earlier runs are not re-encoded
+        self.embedding_store = embedding_store
+        self.batch_size = batch_size
+        self.topic_regexes = {}
+        self.topic_vectors = {}
+        self.counters = {"short_abstract": 0, "keyword_match": 0, "embedding_reject": 0, "embedding_accept": 0, "llm": 0}
+        #the topic check stage runs several workers that share one prefilter
+        self.lock = threading.Lock()
+
+    def get_topic_regex(self, topic):
+        #compiled once per topic and reused for every article
+        if topic not in self.topic_regexes:
+            self.topic_regexes[topic] = make_topic_regex([topic] + list(self.synonyms.get(topic, [])))
+        return self.topic_regexes[topic]
+
+    def encode(self, texts):
+        if self.embedding_store is not None:
+            vectors = self.embedding_store.encode(texts, self.encoder, batch_size=self.batch_size)
+        else:
+            vectors = np.asarray(self.encoder.encode(texts, batch_size=self.batch_size), dtype=np.float32)
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+    def get_topic_vector(self, topic):
+        if topic not in self.topic_vectors:
+            self.topic_vectors[topic] = self.encode([topic])[0]
+        return self.topic_vectors[topic]
+
+    def count(self, stage):
+        with self.lock:
+            self.counters[stage] += 1
+
+    def check(self, topic, abstract):
+        #returns a topic check response ("Yes: ..." / "No ...") or None when the LLM should decide
+        abstract = (abstract or '').strip()
+        if len(abstract) < self.min_abstract_chars:
+            self.count("short_abstract")
+            return "No (prefilter: empty or short abstract)"
+
+        topic_match = self.get_topic_regex(topic).search(abstract)
+        if topic_match:
+            self.count("keyword_match")
+            return f"Yes: {matching_sentence(abstract, topic_match)}"
+
+        if self.encoder is not None and (self.reject_threshold is not None or self.accept_threshold is not None):
+            similarity = float(self.encode([abstract])[0] @ self.get_topic_vector(topic))
+            if self.reject_threshold is not None and similarity < self.reject_threshold:
+                self.count("embedding_reject")
+                return f"No (prefilter: topic similarity {similarity:.2f})"
+            if self.accept_threshold is not None and similarity >= self.accept_threshold:
+                self.count("embedding_accept")
+                return f"Yes (prefilter: topic similarity {similarity:.2f})"
+
+        self.count("llm")
+        return None
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters)
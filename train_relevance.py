@@ -0,0 +1,235 @@
+#scripted retraining of the relevance model, replacing the manual steps in train_auto_review_model.ipynb
+#e.g. python train_relevance.py --input-csv paper_agent_list_061223.csv --fields title abstract query --output-dir models/relevance
+#weekly update from newly labelled sheet rows: python train_relevance.py --from-sheet --warm-start-from models/relevance/<version>
+#features are read from / appended to the embedding store, so only titles (and abstracts / queries) not seen before are encoded
+import argparse
+import copy
+import csv
+from datetime import datetime
+import json
+import os
+import pickle
+import uuid
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.calibration import CalibratedClassifierCV
+from sklearn.linear_model import LogisticRegression, SGDClassifier
+from sklearn.metrics import confusion_matrix, roc_auc_score
+from sklearn.model_selection import StratifiedKFold
+from article import Article
+from dedup import hash_key, normalize_title
+import relevance_model as rm
+
+LABEL_COLUMN = 'Relevant?'
+MODEL_FILENAME = 'model.pkl'
+TRAINING_KEYS_FILENAME = 'training_keys.json'
+METRIC_NAMES = ['accuracy', 'roc_auc', 'sensitivity', 'specificity', 'precision']
+
+def make_model(family):
+    #candidate model families compared on the same embedding features
+    if family == 'logreg':
+        return LogisticRegression(max_iter=1000)
+    elif family == 'logreg_balanced':
+        #relevant articles are the minority class - trades specificity for sensitivity
+        return LogisticRegression(max_iter=1000, class_weight='balanced')
+    elif family == 'sgd':
+        #logistic loss fitted by SGD - supports partial_fit for incremental updates
+        return SGDClassifier(loss='log_loss', alpha=1e-4, max_iter=1000, tol=1e-4, random_state=42)
+    elif family == 'xgboost':
+        import xgboost as xgb
+        return xgb.XGBClassifier(objective='binary:logistic', n_estimators=200, max_depth=4, learning_rate=0.1, n_jobs=1, random_state=42)
+    raise ValueError(f"Unknown model family: {family}")
+
+def load_labelled_rows(input_csv=None, sheet_store=None, label_column=LABEL_COLUMN):
+    #rows with a Y / N label in label_column, from a sheet export or straight from the sheet
+    if input_csv is not None:
+        with open(input_csv, newline='') as f:
+            rows = list(csv.DictReader(f))
+    else:
+        values = sheet_store.get_all_values()
+        header = values[0]
+        rows = [dict(zip(header, row)) for row in values[1:]]
+    return [row for row in rows if str(row.get(label_column, '')).strip().upper() in ('Y', 'N')]
+
+def row_key(row):
+    #identifies a labelled row across retrains - the same paper found by two queries is two rows
+    return hash_key('row', normalize_title(row.get('Title', '')) + '|' + str(row.get('Query', ''))).hex()
+
+def rows_to_articles(rows):
+    return [Article(title=row.get('Title', ''), abstract=row.get('Abstract', ''), query=row.get('Query', ''), source=row.get('Source', '')) for row in rows]
+
+def rows_to_labels(rows, label_column=LABEL_COLUMN):
+    return np.array([1 if str(row[label_column]).strip().upper() == 'Y' else 0 for row in rows])
+
+def evaluate(y_true, y_prob, threshold=0.5):
+    #same metrics as the notebook's evaluate
+    y_pred = (y_prob >= threshold).astype(int)
+    true_negative, false_positive, false_negative, true_positive = confusion_matrix(y_true, y_pred, labels=[0, 1]).ravel()
+    return {
+        'accuracy': float((true_positive + true_negative) / len(y_true)),
+        'roc_auc': float(roc_auc_score(y_true, y_prob)) if len(set(y_true)) == 2 else float('nan'),
+        'sensitivity': float(true_positive / (true_positive + false_negative)) if true_positive + false_negative else float('nan'),
+        'specificity': float(true_negative / (true_negative + false_positive)) if true_negative + false_positive else float('nan'),
+        'precision': float(true_positive / (true_positive + false_positive)) if true_positive + false_positive else float('nan')
+    }
+
+def evaluate_fold(family, features, labels, train_idx, test_idx, threshold):
+    model = make_model(family).fit(features[train_idx], labels[train_idx])
+    return family, evaluate(labels[test_idx], model.predict_proba(features[test_idx])[:, 1], threshold)
+
+def cross_validate_families(features, labels, families, n_folds=7, n_jobs=-1, threshold=0.5):
+    #every (family, fold) pair is fitted in parallel across cores rather than one model family after another
+    folds = list(StratifiedKFold(n_splits=n_folds, shuffle=True, random_state=42).split(features, labels))
+    fold_results = Parallel(n_jobs=n_jobs)(
+        delayed(evaluate_fold)(family, features, labels, train_idx, test_idx, threshold)
+        for family in families for train_idx, test_idx in folds
+    )
+
+    cv_metrics = {}
+    for family in families:
+        family_results = [metrics for result_family, metrics in fold_results if result_family == family]
+        cv_metrics[family] = {
+            metric: {'mean': float(np.nanmean([metrics[metric] for metrics in family_results])), 'std': float(np.nanstd([metrics[metric] for metrics in family_results]))}
+            for metric in METRIC_NAMES
+        }
+    return cv_metrics
+
+def fit_final_model(family, features, labels, calibrate=False, n_folds=7):
+    #final model is fitted on every labelled row - cross validation is only used to estimate its performance
+    model = make_model(family)
+    if calibrate:
+        #sigmoid calibration so predict_proba can be thresholded directly (run_relevance_model_threshold)
+        model = CalibratedClassifierCV(model, method='sigmoid', cv=n_folds)
+    return model.fit(features, labels)
+
+def warm_start_model(previous_model, features, labels, new_idx):
+    #SGD models take a partial_fit pass over the new rows only, logistic regression refits every row starting from
+    #the previous coefficients, which converges in a few iterations as the cached features make the full set cheap
+    model = copy.deepcopy(previous_model)
+    if isinstance(model, CalibratedClassifierCV):
+        return model.fit(features, labels)
+    if hasattr(model, 'partial_fit'):
+        return model.partial_fit(features[new_idx], labels[new_idx])
+    if hasattr(model, 'get_booster'):
+        #xgboost has no warm_start parameter - boosting continues from the previous trees, adding n_estimators more
+        return model.fit(features, labels, xgb_model=model.get_booster())
+    if 'warm_start' in model.get_params():
+        model.set_params(warm_start=True)
+    return model.fit(features, labels)
+
+def load_artifact(artifact_dirpath):
+    with open(os.path.join(artifact_dirpath, MODEL_FILENAME), 'rb') as f:
+        model = pickle.load(f)
+    with open(os.path.join(artifact_dirpath, rm.RELEVANCE_METADATA_FILENAME)) as f:
+        metadata = json.load(f)
+    with open(os.path.join(artifact_dirpath, TRAINING_KEYS_FILENAME)) as f:
+        training_keys = json.load(f)
+    return model, metadata, training_keys
+
+def save_artifact(output_dir, model, metadata, training_keys):
+    #one directory per version - written to a temporary directory then renamed so a half written artifact is never picked up
+    version_dirpath = os.path.join(output_dir, metadata['version'])
+    tmp_dirpath = version_dirpath + '.tmp'
+    os.makedirs(tmp_dirpath)
+    with open(os.path.join(tmp_dirpath, MODEL_FILENAME), 'wb') as f:
+        pickle.dump(model, f, protocol=pickle.HIGHEST_PROTOCOL)
+    with open(os.path.join(tmp_dirpath, rm.RELEVANCE_METADATA_FILENAME), 'w') as f:
+        json.dump(metadata, f, indent=2)
+    with open(os.path.join(tmp_dirpath, TRAINING_KEYS_FILENAME), 'w') as f:
+        json.dump(training_keys, f)
+    os.replace(tmp_dirpath, version_dirpath)
+    return version_dirpath
+
+def train_relevance(rows, encoder_path, embedding_store_path=None, fields=('title',), max_abstract_chars=1000, families=('logreg', 'logreg_balanced', 'sgd'),
+                    n_folds=7, n_jobs=-1, selection_metric='roc_auc', threshold=0.5, calibrate=False, output_dir='models/relevance', warm_start_from=None, run_cv=True,
+                    label_column=LABEL_COLUMN):
+    keys = [row_key(row) for row in rows]
+    labels = rows_to_labels(rows, label_column)
+    print(f"Training rows: {len(rows)} ({int(labels.sum())} relevant)")
+
+    previous_model = previous_metadata = None
+    if warm_start_from is not None:
+        previous_model, previous_metadata, previous_keys = load_artifact(warm_start_from)
+        #features have to match the model being updated
+        fields = tuple(previous_metadata['fields'])
+        max_abstract_chars = previous_metadata['max_abstract_chars']
+        encoder_path = previous_metadata['encoder_id']
+        threshold = previous_metadata['threshold']
+        previous_keys = set(previous_keys)
+        new_idx = np.array([idx for idx, key in enumerate(keys) if key not in previous_keys], dtype=int)
+        print(f"Newly labelled rows since {previous_metadata['version']}: {len(new_idx)}")
+        if len(new_idx) == 0:
+            print("No new labels - nothing to update")
+            return warm_start_from
+
+    encoder = rm.get_encoder(encoder_path)
+    embedding_store = rm.get_embedding_store(embedding_store_path, encoder_path) if embedding_store_path else None
+    features = rm.make_relevance_features(rows_to_articles(rows), encoder, fields=fields, max_abstract_chars=max_abstract_chars, embedding_store=embedding_store)
+    if embedding_store is not None:
+        print("Embedding store summary: ", embedding_store.stats())
+
+    if previous_model is not None:
+        family = previous_metadata['family']
+        cv_metrics = cross_validate_families(features, labels, [family], n_folds=n_folds, n_jobs=n_jobs, threshold=threshold) if run_cv else previous_metadata['cv_metrics']
+        model = warm_start_model(previous_model, features, labels, new_idx)
+    else:
+        cv_metrics = cross_validate_families(features, labels, list(families), n_folds=n_folds, n_jobs=n_jobs, threshold=threshold)
+        family = max(cv_metrics, key=lambda family: cv_metrics[family][selection_metric]['mean'])
+        model = fit_final_model(family, features, labels, calibrate=calibrate, n_folds=n_folds)
+
+    for cv_family, metrics in cv_metrics.items():
+        print(f"{cv_family:<16}" + "  ".join(f"{metric} {metrics[metric]['mean']:.3f}±{metrics[metric]['std']:.3f}" for metric in METRIC_NAMES))
+    print("Selected model family: ", family)
+
+    metadata = {
+        #timestamp for ordering plus a random suffix so two runs in the same second get their own directories
+        'version': datetime.now().strftime('%Y%m%d_%H%M%S') + '_' + uuid.uuid4().hex[:6],
+        'parent_version': previous_metadata['version'] if previous_metadata is not None else None,
+        'family': family,
+        'encoder_id': encoder_path,
+        'fields': list(fields),
+        'max_abstract_chars': max_abstract_chars,
+        'threshold': threshold,
+        'calibrated': isinstance(model, CalibratedClassifierCV),
+        'n_train': len(rows),
+        'n_relevant': int(labels.sum()),
+        'n_folds': n_folds,
+        'selection_metric': selection_metric,
+        'cv_metrics': cv_metrics
+    }
+    version_dirpath = save_artifact(output_dir, model, metadata, keys)
+    print("Saved relevance model to ", version_dirpath)
+    return version_dirpath
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    input_group = parser.add_mutually_exclusive_group(required=True)
+    input_group.add_argument("--input-csv", help="labelled sheet export e.g. paper_agent_list_061223.csv")
+    input_group.add_argument("--from-sheet", action="store_true", help="read labelled rows from the sheet in config.py setup_config")
+    parser.add_argument("--label-column", default=LABEL_COLUMN)
+    parser.add_argument("--encoder-path", default="sentence-transformers/all-MiniLM-L6-v2")
+    parser.add_argument("--embedding-store-path", default="embedding_store", help="set to '' to encode without caching")
+    parser.add_argument("--fields", nargs="+", default=["title"], choices=rm.RELEVANCE_FIELDS)
+    parser.add_argument("--max-abstract-chars", type=int, default=1000)
+    parser.add_argument("--families", nargs="+", default=["logreg", "logreg_balanced", "sgd"], choices=["logreg", "logreg_balanced", "sgd", "xgboost"])
+    parser.add_argument("--folds", type=int, default=7)
+    parser.add_argument("--n-jobs", type=int, default=-1, help="parallel (family, fold) fits, -1 for every core")
+    parser.add_argument("--selection-metric", default="roc_auc", choices=METRIC_NAMES)
+    parser.add_argument("--threshold", type=float, default=0.5, help="probability threshold for Y, used in CV metrics and saved for scoring")
+    parser.add_argument("--calibrate", action="store_true", help="sigmoid calibrate the final model's probabilities")
+    parser.add_argument("--output-dir", default="models/relevance")
+    parser.add_argument("--warm-start-from", help="previous artifact directory to update with newly labelled rows")
+    parser.add_argument("--skip-cv", action="store_true", help="with --warm-start-from, reuse the previous CV metrics")
+    args = parser.parse_args()
+
+    sheet_store = None
+    if args.from_sheet:
+        import config as cf
+        from utils import GSpreadBackend, SheetStore
+        sheet_store = SheetStore(GSpreadBackend(cf.setup_config["gsheet_key"], cf.setup_config["credentials_key_path"]), cf.setup_config["gsheet_tab_name"])
+
+    labelled_rows = load_labelled_rows(input_csv=args.input_csv, sheet_store=sheet_store, label_column=args.label_column)
+    train_relevance(labelled_rows, args.encoder_path, embedding_store_path=args.embedding_store_path or None, fields=tuple(args.fields),
+                    max_abstract_chars=args.max_abstract_chars, families=args.families, n_folds=args.folds, n_jobs=args.n_jobs,
+                    selection_metric=args.selection_metric, threshold=args.threshold, calibrate=args.calibrate, output_dir=args.output_dir,
+                    warm_start_from=args.warm_start_from, run_cv=not args.skip_cv, label_column=args.label_column)
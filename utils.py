@@ -1,61 +1,139 @@
 import csv
 import gspread
+import numpy as np
+import random
+import time
 from google.oauth2.service_account import Credentials
-from pydrive.auth import GoogleAuth
-from pydrive.drive import GoogleDrive
+import instrumentation as im
+
 
 def save_articles_to_csv(articles, filename):
     with open(filename, mode='w', newline='') as file:
         writer = csv.writer(file)
         writer.writerow(['Title', 'Abstract', 'Published', 'Source'])
         for article in articles:
-            title = article['Title']
-            abstract = article['Abstract']
-            published = article['Published']
-            source = article['Source']
-            writer.writerow([title, abstract, published, source])
+            writer.writerow([article.title, article.abstract, article.published, article.source])
     print(f"Saved {len(articles)} articles to {filename}")
 
 
-def add_articles_to_gsheet(articles, gsheet_key, credentials_key_path, gsheet_tab_name):
-    #setup connection - pre-requisite steps detailed here - # https://medium.com/@jb.ranchana/write-and-append-dataframes-to-google-sheets-in-python-f62479460cf0
-    scopes = ['https://www.googleapis.com/auth/spreadsheets',
-          'https://www.googleapis.com/auth/drive']
+class GSpreadBackend:
+    #authenticates once and caches the opened spreadsheet and worksheet handles
+    #pre-requisite steps detailed here - # https://medium.com/@jb.ranchana/write-and-append-dataframes-to-google-sheets-in-python-f62479460cf0
+    def __init__(self, gsheet_key, credentials_key_path):
+        self.gsheet_key = gsheet_key
+        self.credentials_key_path = credentials_key_path
+        self.spreadsheet = None
+        self.worksheets = {}
 
-    credentials = Credentials.from_service_account_file(credentials_key_path, scopes=scopes)
+    def open(self):
+        if self.spreadsheet is None:
+            scopes = ['https://www.googleapis.com/auth/spreadsheets',
+                  'https://www.googleapis.com/auth/drive']
+            credentials = Credentials.from_service_account_file(self.credentials_key_path, scopes=scopes)
+            gc = gspread.authorize(credentials)
+            self.spreadsheet = gc.open_by_key(self.gsheet_key)
+        return self.spreadsheet
 
-    gc = gspread.authorize(credentials)
+    def worksheet(self, gsheet_tab_name):
+        if gsheet_tab_name not in self.worksheets:
+            self.worksheets[gsheet_tab_name] = self.open().worksheet(gsheet_tab_name)
+        return self.worksheets[gsheet_tab_name]
 
-    gauth = GoogleAuth()
-    drive = GoogleDrive(gauth)
+    def col_values(self, gsheet_tab_name, tgt_col_num):
+        with im.timer("sheet.read"):
+            return self.worksheet(gsheet_tab_name).col_values(tgt_col_num)
 
-    gs = gc.open_by_key(gsheet_key)
-    article_values = [list(article.values()) for article in articles]
-    gs.values_append(gsheet_tab_name, {'valueInputOption': 'RAW'}, {'values': article_values})
+    def get_all_values(self, gsheet_tab_name):
+        with im.timer("sheet.read"):
+            return self.worksheet(gsheet_tab_name).get_all_values()
 
-    print("Added ", len(articles), " articles to google sheet")
+    def values_append(self, gsheet_tab_name, rows):
+        with im.timer("sheet.append"):
+            self.open().values_append(gsheet_tab_name, {'valueInputOption': 'RAW'}, {'values': rows})
 
-def get_worksheet_title_list(gsheet_key, credentials_key_path, gsheet_tab_name, tgt_col_num):
-    #setup connection - pre-requisite steps detailed here - # https://medium.com/@jb.ranchana/write-and-append-dataframes-to-google-sheets-in-python-f62479460cf0
-    scopes = ['https://www.googleapis.com/auth/spreadsheets',
-          'https://www.googleapis.com/auth/drive']
+class InMemorySheetBackend:
+    #stand-in for GSpreadBackend when testing or benchmarking without google credentials
+    def __init__(self, tabs=None):
+        self.tabs = tabs if tabs is not None else {}
+        self.append_calls = 0
+
+    def col_values(self, gsheet_tab_name, tgt_col_num):
+        rows = self.tabs.get(gsheet_tab_name, [])
+        return [row[tgt_col_num - 1] if len(row) >= tgt_col_num else '' for row in rows]
+
+    def get_all_values(self, gsheet_tab_name):
+        return [list(row) for row in self.tabs.get(gsheet_tab_name, [])]
+
+    def values_append(self, gsheet_tab_name, rows):
+        self.append_calls += 1
+        self.tabs.setdefault(gsheet_tab_name, []).extend([list(row) for row in rows])
+
+class SheetStore:
+    #buffers appended articles across all queries and writes them in as few values_append calls as possible
+    def __init__(self, backend, gsheet_tab_name, max_rows_per_append=500, max_retries=5):
+        self.backend = backend
+        self.gsheet_tab_name = gsheet_tab_name
+        #keeps each request well under the sheets API payload limit as abstracts make rows large
+        self.max_rows_per_append = max_rows_per_append
+        self.max_retries = max_retries
+        self.pending_rows = []
 
-    credentials = Credentials.from_service_account_file(credentials_key_path, scopes=scopes)
+    def get_col_lists(self, tgt_col_nums):
+        return [self.backend.col_values(self.gsheet_tab_name, tgt_col_num) for tgt_col_num in tgt_col_nums]
 
-    gc = gspread.authorize(credentials)
+    def get_all_values(self):
+        #every row including the header, e.g. to read back manual labels added after the SHEET_COLUMNS
+        return self.backend.get_all_values(self.gsheet_tab_name)
 
-    gauth = GoogleAuth()
-    drive = GoogleDrive(gauth)
+    def append_articles(self, articles):
+        self.pending_rows.extend([article.to_row() for article in articles])
 
-    gs = gc.open_by_key(gsheet_key)
+    @im.timed("sheet.flush")
+    def flush(self):
+        n_rows = 0
+        while self.pending_rows:
+            chunk = self.pending_rows[:self.max_rows_per_append]
+            self.values_append_with_retry(chunk)
+            #dropped as soon as they are written, so a later chunk failing does not append them again on the next flush
+            del self.pending_rows[:len(chunk)]
+            n_rows += len(chunk)
+            im.incr("sheet.rows_appended", len(chunk))
+        print("Added ", n_rows, " articles to google sheet")
+        return n_rows
 
-    target_tab = gs.worksheet(gsheet_tab_name)
-    tgt_list = target_tab.col_values(tgt_col_num)
-    # print("Target values: ", tgt_list)
-    return tgt_list
+    def values_append_with_retry(self, rows):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self.backend.values_append(self.gsheet_tab_name, rows)
+            except gspread.exceptions.APIError as e:
+                #only quota (429) and server errors are worth retrying
+                status_code = e.response.status_code if getattr(e, 'response', None) is not None else None
+                if attempt == self.max_retries or (status_code is not None and status_code != 429 and status_code < 500):
+                    raise
+                backoff = min(64, 2 ** attempt) + random.uniform(0, 1)
+                im.incr("sheet.retries")
+                print(f"Google sheet append failed ({status_code}), retrying in {backoff:.1f}s")
+                time.sleep(backoff)
+
+def add_articles_to_gsheet(articles, gsheet_key, credentials_key_path, gsheet_tab_name):
+    sheet_store = SheetStore(GSpreadBackend(gsheet_key, credentials_key_path), gsheet_tab_name)
+    sheet_store.append_articles(articles)
+    sheet_store.flush()
+
+def get_worksheet_title_list(gsheet_key, credentials_key_path, gsheet_tab_name, tgt_col_num):
+    sheet_store = SheetStore(GSpreadBackend(gsheet_key, credentials_key_path), gsheet_tab_name)
+    return sheet_store.get_col_lists([tgt_col_num])[0]
 
 def parse_relevance_pred(raw_pred):
     if raw_pred == 1:
         return "Y"
     else:
         return "N"
+
+def parse_relevance_preds(raw_preds):
+    #vectorised version of parse_relevance_pred for a batch of predictions
+    return np.where(np.asarray(raw_preds).ravel() == 1, "Y", "N").tolist()
+
+def parse_relevance_probs(probs, threshold=0.5):
+    #Y where the predicted probability of relevant is at or above threshold
+    return np.where(np.asarray(probs).ravel() >= threshold, "Y", "N").tolist()
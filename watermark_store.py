@@ -0,0 +1,40 @@
+import json
+import os
+import threading
+
+class WatermarkStore:
+    #persists a per (query, source) high-water mark so daily runs only request items newer than the last run
+    #updates are held in memory until save() so a failed run does not skip articles it never wrote to the sheet
+    def __init__(self, watermark_path):
+        self.watermark_path = watermark_path
+        self.lock = threading.Lock()
+        self.watermarks = {}
+        if os.path.exists(watermark_path):
+            with open(watermark_path) as f:
+                self.watermarks = json.load(f)
+        self.pending_watermarks = {}
+
+    def make_key(self, query, source):
+        return f'{source}|{query}'
+
+    def get(self, query, source):
+        return self.watermarks.get(self.make_key(query, source))
+
+    def update(self, query, source, watermark):
+        if watermark is None:
+            return
+        with self.lock:
+            key = self.make_key(query, source)
+            current_watermark = self.pending_watermarks.get(key, self.watermarks.get(key))
+            #watermarks are ISO / YYYY/MM/DD strings so they compare in date order
+            if current_watermark is None or watermark > current_watermark:
+                self.pending_watermarks[key] = watermark
+
+    def save(self):
+        with self.lock:
+            self.watermarks.update(self.pending_watermarks)
+            self.pending_watermarks = {}
+            tmp_path = self.watermark_path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(self.watermarks, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.watermark_path)